@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from app.enrichment import enrichment_queue
+from app.gov_data import get_cars_info_from_gov_db
+from app.mongo_client import CARS, CUSTOMERS, Repairs, RepairsFinish
+
+ARRIVAL_TTL = float(os.getenv('GARAGE_ARRIVAL_TTL', 300))
+ARRIVAL_PLATES = int(os.getenv('GARAGE_ARRIVAL_PLATES', 2000))
+# Finished repairs kept per bundle, newest first
+ARRIVAL_HISTORY = int(os.getenv('GARAGE_ARRIVAL_HISTORY', 20))
+# Plates loaded together, with one query per collection
+ARRIVAL_BATCH = 100
+
+logger = logging.getLogger(__name__)
+
+
+class ArrivalCache:
+    """
+    Short-lived, per-worker cache of what the front desk opens when a car
+    arrives: the car, its customers, its open repairs and its finished ones.
+    Camera arrivals prefetch the bundle in the background so the desk screen
+    is served from memory.
+
+    Writes made through this worker drop the plate's bundle; writes made
+    elsewhere show up once the bundle expires after GARAGE_ARRIVAL_TTL.
+    """
+
+    def __init__(self, ttl: float = ARRIVAL_TTL, max_plates: int = ARRIVAL_PLATES):
+        self._ttl = ttl
+        self._max_plates = max_plates
+        # plate -> (monotonic load time, bundle)
+        self._bundles: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._loading: dict[str, asyncio.Task] = {}
+        # Bumped per plate on invalidation, so a load that raced a write to
+        # that plate doesn't keep its bundle
+        self._generations = Counter()
+        self.stats = Counter()
+
+    def _fresh(self, plate: str) -> dict | None:
+        entry = self._bundles.get(plate)
+        if entry is None:
+            return None
+        loaded, bundle = entry
+        if time.monotonic() - loaded > self._ttl:
+            del self._bundles[plate]
+            return None
+        return bundle
+
+    def prefetch(self, plates: list[str]) -> None:
+        plates = [plate for plate in dict.fromkeys(plates)
+                  if plate not in self._loading and self._fresh(plate) is None]
+        for start in range(0, len(plates), ARRIVAL_BATCH):
+            self._start(plates[start:start + ARRIVAL_BATCH])
+        self.stats['prefetched'] += len(plates)
+
+    def _start(self, plates: list[str]) -> asyncio.Task:
+        # One load per plate at a time, so its generation only matters while loading
+        task = asyncio.create_task(self._load(plates))
+        task.add_done_callback(self._loaded)
+        for plate in plates:
+            self._loading[plate] = task
+        return task
+
+    def _loaded(self, task: asyncio.Task) -> None:
+        for plate in [plate for plate, loading in self._loading.items() if loading is task]:
+            del self._loading[plate]
+            self._generations.pop(plate, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed loading arrival bundles", exc_info=task.exception())
+
+    async def bundle(self, plate: str) -> dict:
+        bundle = self._fresh(plate)
+        if bundle is not None:
+            self.stats['hits'] += 1
+            self._bundles.move_to_end(plate)
+            return bundle
+
+        self.stats['misses'] += 1
+        task = self._loading.get(plate)
+        if task is not None:
+            try:
+                # Shielded, so a client hanging up doesn't cancel the prefetch
+                return (await asyncio.shield(task))[plate]
+            except Exception:
+                pass  # Already logged, load it here instead
+        return (await asyncio.shield(self._start([plate])))[plate]
+
+    def forget(self, *plates: str) -> None:
+        for plate in plates:
+            if plate in self._loading:
+                self._generations[plate] += 1
+            self._bundles.pop(plate, None)
+
+    async def _load(self, plates: list[str]) -> dict[str, dict]:
+        generations = {plate: self._generations[plate] for plate in plates}
+        cars, customers, repairs, history = await asyncio.gather(
+            CARS.find({"license_plate_number": {"$in": plates}}).to_list(length=None),
+            CUSTOMERS.find({"cars": {"$in": plates}}).to_list(length=None),
+            Repairs.find({"license_plate_number": {"$in": plates}}).to_list(length=None),
+            RepairsFinish.find({"license_plate_number": {"$in": plates}},
+                               sort=[('time_stamp_end', -1)]).to_list(length=None),
+        )
+
+        bundles = {plate: {"license_plate_number": plate, "car": None, "customers": [], "repairs": [],
+                           "history": [], "government_data": None, "loaded_at": datetime.utcnow()}
+                   for plate in plates}
+        for car in cars:
+            bundles[car['license_plate_number']]['car'] = car
+        for customer in customers:
+            for plate in customer.get('cars') or []:
+                if plate in bundles:
+                    bundles[plate]['customers'].append(customer)
+        for repair in repairs:
+            bundles[repair['license_plate_number']]['repairs'].append(repair)
+        for repair in history:
+            finished = bundles[repair['license_plate_number']]['history']
+            if len(finished) < ARRIVAL_HISTORY:
+                finished.append(repair)
+
+        await self._enrich(bundles)
+
+        now = time.monotonic()
+        for plate, bundle in bundles.items():
+            if generations[plate] == self._generations[plate]:
+                self._bundles[plate] = (now, bundle)
+                self._bundles.move_to_end(plate)
+        while len(self._bundles) > self._max_plates:
+            self._bundles.popitem(last=False)
+        return bundles
+
+    async def _enrich(self, bundles: dict[str, dict]) -> None:
+        # Known cars still missing government data join the enrichment queue;
+        # unknown plates are looked up now, which also warms the lookup cache
+        # for when the car is added
+        unknown = []
+        for plate, bundle in bundles.items():
+            car = bundle['car']
+            if car is None:
+                unknown.append(plate)
+            elif car.get('government_data') is None:
+                enrichment_queue.submit(car['_id'], plate)
+        if not unknown:
+            return
+
+        try:
+            results = await get_cars_info_from_gov_db(unknown)
+        except Exception:
+            logger.exception("Failed looking up arriving plates %s", unknown)
+            return
+        for plate in unknown:
+            bundles[plate]['government_data'] = results.get(plate)
+
+    def describe(self) -> dict:
+        return {"plates": len(self._bundles), "loading": len(self._loading), **self.stats}
+
+
+arrival_cache = ArrivalCache()
+# Bundles of cars that just got their government data would otherwise serve it
+# missing until they expire
+enrichment_queue.on_enriched.append(arrival_cache.forget)
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from enum import Enum
+
+from app.mongo_client import CUSTOMERS, Storage
+
+AUTOCOMPLETE_MAX_LIMIT = int(os.getenv('GARAGE_AUTOCOMPLETE_MAX_LIMIT', 50))
+# Full reload interval, picks up writes made by other workers
+AUTOCOMPLETE_REFRESH = float(os.getenv('GARAGE_AUTOCOMPLETE_REFRESH', 300))
+# How many matching terms are looked at before ranking, bounds the lookup time
+AUTOCOMPLETE_SCAN = 200
+
+NIQQUD = re.compile(r'[֑-ׇ]')
+NON_DIGITS = re.compile(r'\D')
+
+logger = logging.getLogger(__name__)
+
+
+class AutocompleteKind(str, Enum):
+    customers = 'customers'
+    storage = 'storage'
+
+
+def normalize(text) -> str:
+    text = unicodedata.normalize('NFKC', str(text))
+    return ' '.join(NIQQUD.sub('', text).lower().split())
+
+
+def text_terms(text) -> set[str]:
+    # The whole text and every word in it, so "fil" finds "oil filter"
+    text = normalize(text)
+    if not text:
+        return set()
+    return {text, *text.split(' ')}
+
+
+def customer_terms(customer: dict) -> set[str]:
+    terms = text_terms(customer.get('name') or '')
+    phone = NON_DIGITS.sub('', customer.get('phone_number') or '')
+    if phone:
+        terms.add(phone)
+    return terms
+
+
+def customer_entry(customer: dict) -> dict:
+    return {"_id": customer['_id'], "kind": AutocompleteKind.customers.value,
+            "label": customer.get('name'), "phone_number": customer.get('phone_number')}
+
+
+def storage_terms(item: dict) -> set[str]:
+    terms = text_terms(item.get('name') or '')
+    barcodes = item.get('barcode') or []
+    for barcode in barcodes if isinstance(barcodes, list) else [barcodes]:
+        terms.add(normalize(barcode))
+    return terms - {''}
+
+
+def storage_entry(item: dict) -> dict:
+    return {"_id": item['_id'], "kind": AutocompleteKind.storage.value,
+            "label": item.get('name'), "barcode": item.get('barcode')}
+
+
+class PrefixIndex:
+    """
+    Sorted array of (term, document id) pairs; a prefix lookup is a bisect to
+    the first candidate followed by a short scan.
+    """
+
+    def __init__(self, collection, terms, entry, projection: dict):
+        self._collection = collection
+        self._terms_of = terms
+        self._entry_of = entry
+        self._projection = projection
+        self._keys: list[tuple[str, str]] = []
+        self._entries: dict[str, dict] = {}
+        self._terms: dict[str, set[str]] = {}
+        self._reload: asyncio.Task | None = None
+
+    async def load(self) -> None:
+        keys = []
+        entries = {}
+        terms = {}
+        async for document in self._collection.find({}, projection=self._projection):
+            _id = str(document['_id'])
+            document['_id'] = _id
+            terms[_id] = self._terms_of(document)
+            entries[_id] = self._entry_of(document)
+            keys.extend((term, _id) for term in terms[_id])
+        keys.sort()
+        # Swap everything at once so lookups never see a half-built index
+        self._keys, self._entries, self._terms = keys, entries, terms
+
+    def reload_soon(self) -> None:
+        # For bulk writes, where reloading beats patching row by row
+        if self._reload is None or self._reload.done():
+            self._reload = asyncio.create_task(self.load())
+
+    def remove(self, _id) -> None:
+        _id = str(_id)
+        for term in self._terms.pop(_id, ()):
+            position = bisect_left(self._keys, (term, _id))
+            if position < len(self._keys) and self._keys[position] == (term, _id):
+                del self._keys[position]
+        self._entries.pop(_id, None)
+
+    def upsert(self, document: dict) -> None:
+        _id = str(document['_id'])
+        self.remove(_id)
+        document = dict(document, _id=_id)
+        self._terms[_id] = self._terms_of(document)
+        self._entries[_id] = self._entry_of(document)
+        for term in self._terms[_id]:
+            insort(self._keys, (term, _id))
+
+    def search(self, prefix: str, limit: int) -> list[tuple[str, dict]]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        best: dict[str, str] = {}
+        position = bisect_left(self._keys, (prefix, ''))
+        for term, _id in self._keys[position:position + AUTOCOMPLETE_SCAN]:
+            if not term.startswith(prefix):
+                break
+            # Keep the shortest matching term per document, it ranks closest
+            if _id not in best or len(term) < len(best[_id]):
+                best[_id] = term
+
+        ranked = sorted(best.items(), key=lambda match: (len(match[1]), match[1]))[:limit]
+        return [(term, self._entries[_id]) for _id, term in ranked]
+
+
+customers_index = PrefixIndex(CUSTOMERS, customer_terms, customer_entry,
+                              projection={"name": 1, "phone_number": 1})
+storage_index = PrefixIndex(Storage, storage_terms, storage_entry,
+                            projection={"name": 1, "barcode": 1})
+INDEXES = {
+    AutocompleteKind.customers: customers_index,
+    AutocompleteKind.storage: storage_index,
+}
+
+
+def autocomplete(prefix: str, kinds: list[AutocompleteKind], limit: int) -> list[dict]:
+    matches = [match for kind in kinds for match in INDEXES[kind].search(prefix, limit)]
+    matches.sort(key=lambda match: (len(match[0]), match[0]))
+    return [entry for _, entry in matches[:limit]]
+
+
+async def keep_indexes_fresh(interval: float = AUTOCOMPLETE_REFRESH) -> None:
+    while True:
+        for kind, index in INDEXES.items():
+            try:
+                await index.load()
+            except Exception:
+                logger.exception("Failed loading %s autocomplete", kind.value)
+        await asyncio.sleep(interval)
@@ -0,0 +1,43 @@
+import asyncio
+from abc import ABC, abstractmethod
+
+
+class BackgroundWorker(ABC):
+    """
+    Base for the per-worker loops that process work queued by requests.
+    `_run` runs as a single task, started on first use as well as at startup
+    so callers outside the app lifecycle work too. `stop` cancels it and then
+    `_drain`s whatever is still queued, so nothing accepted is lost on shutdown.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self.start()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+        self.ensure_running()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._drain()
+
+    @abstractmethod
+    async def _run(self) -> None:
+        ...
+
+    async def _drain(self) -> None:
+        pass
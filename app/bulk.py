@@ -0,0 +1,121 @@
+import json
+import os
+from http import HTTPStatus
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.streaming import NDJSON_MEDIA_TYPE
+
+BULK_MAX_ROWS = int(os.getenv('GARAGE_BULK_MAX_ROWS', 50000))
+
+
+def bulk_request_body(model: type[BaseModel]) -> dict:
+    # The body is parsed by `read_bulk_rows`, so describe it for the docs here
+    schema = {"type": "array", "items": {"$ref": f"#/components/schemas/{model.__name__}"}}
+    return {"requestBody": {"required": True, "content": {
+        "application/json": {"schema": schema},
+        NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}},
+    }}}
+
+
+async def read_bulk_rows(request: Request) -> list:
+    body = await request.body()
+    try:
+        if NDJSON_MEDIA_TYPE in request.headers.get('content-type', ''):
+            rows = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            rows = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=f"Invalid body: {e}")
+
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Expected an array of rows")
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {BULK_MAX_ROWS} rows per request")
+    return rows
+
+
+def validate_rows(model: type[BaseModel], rows: list,
+                  row_numbers: list[int] | None = None) -> tuple[list[dict], list[dict]]:
+    """
+    Returns the encoded documents of the valid rows, each tagged with its row
+    number under `_row` and the fields the row supplied under `_supplied`,
+    and the error results of the invalid ones. Rows are numbered by position
+    unless `row_numbers` is given.
+    """
+    documents = []
+    errors = []
+    for row_number, row in zip(row_numbers or range(len(rows)), rows):
+        try:
+            item = model.parse_obj(row)
+        except ValidationError as e:
+            errors.append({"row": row_number, "status": "error", "detail": e.errors()})
+            continue
+        document = jsonable_encoder(item)
+        document['_row'] = row_number
+        document['_supplied'] = [model.__fields__[name].alias for name in item.__fields_set__]
+        documents.append(document)
+    return documents, errors
+
+
+def _key_filter(value) -> dict | None:
+    if isinstance(value, list):
+        return {"barcode": {"$in": value}} if value else None
+    return {"barcode": value} if value else None
+
+
+async def bulk_upsert(collection, documents: list[dict], upsert_on_barcode: bool = False) -> list[dict]:
+    """
+    Writes `validate_rows` documents with one unordered bulk_write. Documents
+    with a barcode update the item holding it with the fields their row
+    supplied, leaving the others as stored; defaults only apply when the
+    upsert creates the item. The rest are inserted. Returns a result per
+    document.
+    """
+    if not documents:
+        return []
+
+    operations = []
+    results = []
+    for document in documents:
+        row_number = document.pop('_row')
+        supplied = set(document.pop('_supplied')) - {'_id'}
+        key = _key_filter(document.get('barcode')) if upsert_on_barcode else None
+        if key is None:
+            operations.append(InsertOne(document))
+            results.append({"row": row_number, "status": "inserted", "_id": document['_id']})
+        else:
+            changes = {field: value for field, value in document.items() if field in supplied}
+            defaults = {field: value for field, value in document.items() if field not in supplied}
+            operations.append(UpdateOne(key, {"$set": changes, "$setOnInsert": defaults}, upsert=True))
+            # Upserts only report an _id when they created a document, see below
+            results.append({"row": row_number, "status": "updated", "barcode": document['barcode']})
+
+    try:
+        outcome = (await collection.bulk_write(operations, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        outcome = e.details
+        for error in e.details['writeErrors']:
+            results[error['index']] = {"row": results[error['index']]['row'], "status": "error",
+                                       "detail": error['errmsg']}
+
+    for upserted in outcome.get('upserted', []):
+        results[upserted['index']] = {"row": results[upserted['index']]['row'], "status": "inserted",
+                                      "_id": upserted['_id']}
+
+    return results
+
+
+def summarize(results: list[dict]) -> dict:
+    results = sorted(results, key=lambda result: result['row'])
+    return {
+        "inserted": sum(result['status'] == 'inserted' for result in results),
+        "updated": sum(result['status'] == 'updated' for result in results),
+        "failed": sum(result['status'] == 'error' for result in results),
+        "rows": results,
+    }
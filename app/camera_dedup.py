@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from app.background import BackgroundWorker
+
+CAMERA_DEDUP_WINDOW = float(os.getenv('GARAGE_CAMERA_DEDUP_WINDOW', 30))
+CAMERA_DEDUP_PLATES = int(os.getenv('GARAGE_CAMERA_DEDUP_PLATES', 10000))
+
+logger = logging.getLogger(__name__)
+
+
+class PlateDeduplicator(BackgroundWorker):
+    """
+    Collapses repeated reads of a plate into one event. Reads of the same
+    plate no more than `window` seconds apart extend the open burst, which
+    keeps first seen (`time`), `last_seen` and `hits`. A burst is handed to
+    the sink once the plate has been quiet for a window, or when the plate
+    falls out of the bounded LRU.
+
+    Each worker deduplicates the reads it receives, so a burst spread over
+    several workers is stored at most once per worker.
+    """
+
+    def __init__(self, sink, window: float = CAMERA_DEDUP_WINDOW, max_plates: int = CAMERA_DEDUP_PLATES):
+        super().__init__()
+        self._sink = sink
+        self._window = window
+        self._max_plates = max_plates
+        # plate -> (open burst, monotonic time of its last read)
+        self._bursts: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self.reads = 0
+        self.collapsed = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._window > 0
+
+    def observe(self, documents: list[dict]) -> list[dict]:
+        """
+        Takes new reads and returns the ones that opened a burst, i.e. the
+        arrivals. With deduplication off every read is passed straight on.
+        """
+        self.reads += len(documents)
+        if not self.enabled:
+            self._sink.offer(documents)
+            return documents
+
+        arrivals = []
+        now = time.monotonic()
+        window = timedelta(seconds=self._window)
+        for document in documents:
+            plate = document['license_plate_number']
+            burst, _ = self._bursts.get(plate, (None, None))
+            if burst is not None and abs(document['time'] - burst['last_seen']) <= window:
+                burst['time'] = min(burst['time'], document['time'])
+                burst['last_seen'] = max(burst['last_seen'], document['time'])
+                burst['hits'] += 1
+                self._bursts[plate] = (burst, now)
+                self._bursts.move_to_end(plate)
+                self.collapsed += 1
+                continue
+
+            if burst is not None:
+                self._close(plate, force=True)
+            self._bursts[plate] = (dict(document, last_seen=document['time'], hits=1), now)
+            arrivals.append(document)
+            while len(self._bursts) > self._max_plates:
+                self._close(next(iter(self._bursts)), force=True)
+
+        self.ensure_running()
+        return arrivals
+
+    def open_burst(self, plate: str) -> dict | None:
+        burst, _ = self._bursts.get(plate, (None, None))
+        return burst
+
+    def _close(self, plate: str, force: bool = False) -> bool:
+        burst, touched = self._bursts.pop(plate)
+        if self._sink.offer([burst]):
+            return True
+        if force:
+            self.dropped += 1
+            logger.error("Camera buffer full, dropped burst of %s", plate)
+            return True
+        # Sink is full, try again on the next sweep
+        self._bursts[plate] = (burst, touched)
+        self._bursts.move_to_end(plate, last=False)
+        return False
+
+    def _sweep(self, everything: bool = False) -> None:
+        deadline = time.monotonic() - self._window
+        # Least recently read first, so the scan stops at the first live burst
+        for plate, (_, touched) in list(self._bursts.items()):
+            if not everything and touched > deadline:
+                break
+            if not self._close(plate, force=everything):
+                break
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(min(self._window / 2, 5))
+            self._sweep()
+
+    async def _drain(self) -> None:
+        self._sweep(everything=True)
+
+    def describe(self) -> dict:
+        return {"window": self._window, "open": len(self._bursts), "reads": self.reads,
+                "collapsed": self.collapsed, "dropped": self.dropped}
@@ -0,0 +1,215 @@
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Query
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+
+from app.mongo_client import Camera, LegacyCamera, Migrations
+from models.camera_model import CameraModel
+
+CAMERA_TTL_DAYS = float(os.getenv('GARAGE_CAMERA_TTL_DAYS', 90))
+# Camera clocks drift; stamps further ahead than this are replaced by the arrival time
+CAMERA_MAX_CLOCK_SKEW = timedelta(days=1)
+CAMERA_MIGRATION_BATCH = 1000
+# A worker that died mid-migration is taken over once its lease runs out
+CAMERA_MIGRATION_LEASE = timedelta(minutes=10)
+
+NUMBER = re.compile(r'\d+(\.\d+)?')
+
+logger = logging.getLogger(__name__)
+
+
+def parse_time_stamp(value: str, received: datetime) -> datetime:
+    """
+    Camera stamps are epoch seconds or milliseconds, or ISO 8601 (naive ones
+    are taken as UTC). Anything unreadable or out of range falls back to the
+    time the event reached the API.
+    """
+    value = value.strip()
+    try:
+        if NUMBER.fullmatch(value):
+            seconds = float(value)
+            if seconds > 1e11:
+                seconds /= 1000
+            parsed = datetime.utcfromtimestamp(seconds)
+        else:
+            parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        return received
+
+    # Older than the retention would be expired on arrival
+    if not received - timedelta(days=CAMERA_TTL_DAYS) < parsed < received + CAMERA_MAX_CLOCK_SKEW:
+        return received
+    return parsed
+
+
+def camera_document(event: CameraModel, received: datetime | None = None) -> dict:
+    received = received or datetime.utcnow()
+    return {"_id": str(event.id), "license_plate_number": event.license_plate_number,
+            "time_stamp": event.time_stamp, "time": parse_time_stamp(event.time_stamp, received)}
+
+
+def _plain_indexes() -> list[IndexModel]:
+    return [
+        IndexModel([('license_plate_number', 1), ('time', -1)], name='plate_time', background=True),
+        IndexModel('time', name='time_ttl', expireAfterSeconds=int(CAMERA_TTL_DAYS * 24 * 3600), background=True),
+    ]
+
+
+async def ensure_camera_collection() -> None:
+    """
+    Creates the camera events collection as a time-series collection keyed by
+    plate, expiring after GARAGE_CAMERA_TTL_DAYS. Servers without time-series
+    support (before 5.0) get a plain collection with the same index and a TTL
+    index instead.
+    """
+    database = Camera.database
+    ttl = int(CAMERA_TTL_DAYS * 24 * 3600)
+    try:
+        await database.create_collection(
+            Camera.name,
+            timeseries={"timeField": "time", "metaField": "license_plate_number", "granularity": "seconds"},
+            expireAfterSeconds=ttl,
+        )
+    except CollectionInvalid:
+        pass  # Already there, from an earlier start
+    except OperationFailure as e:
+        logger.warning("Time-series collections unavailable (%s), using a plain %s collection", e, Camera.name)
+
+    try:
+        options = await Camera.options()
+        if 'timeseries' in options:
+            if options.get('expireAfterSeconds') != ttl:
+                await database.command('collMod', Camera.name, expireAfterSeconds=ttl)
+            await Camera.create_indexes(_plain_indexes()[:1])
+            return
+
+        await Camera.create_indexes(_plain_indexes()[:1])
+        try:
+            await Camera.create_indexes(_plain_indexes()[1:])
+        except OperationFailure:
+            # The TTL index exists with another retention, update it in place
+            await database.command('collMod', Camera.name, index={"name": "time_ttl", "expireAfterSeconds": ttl})
+    except OperationFailure as e:
+        logger.error("Failed preparing %s: %s", Camera.name, e)
+
+    try:
+        await migrate_legacy_events()
+    except OperationFailure as e:
+        logger.error("Failed copying %s events: %s", LegacyCamera.name, e)
+
+
+def _inserted_at(_id) -> datetime:
+    try:
+        return ObjectId(_id).generation_time.replace(tzinfo=None)
+    except (InvalidId, TypeError):
+        return datetime.utcnow()
+
+
+async def _claim_migration(name: str) -> bool:
+    now = datetime.utcnow()
+    try:
+        await Migrations.find_one_and_update(
+            {"_id": name, "done": {"$ne": True}, "lease_until": {"$lt": now}},
+            {"$set": {"lease_until": now + CAMERA_MIGRATION_LEASE}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return False  # Done already, or another worker holds the lease
+    return True
+
+
+async def _copy_events(documents: list[dict]) -> None:
+    times = [document['time'] for document in documents]
+    copied = set(await Camera.distinct('_id', {
+        "_id": {"$in": [document['_id'] for document in documents]},
+        "time": {"$gte": min(times), "$lte": max(times)},
+    }))
+    documents = [document for document in documents if document['_id'] not in copied]
+    if not documents:
+        return
+    try:
+        await Camera.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        # On a plain collection, events copied already are refused as duplicates
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+
+
+async def migrate_legacy_events() -> None:
+    """
+    Copies the events of the old plain `camera` collection into the camera
+    events collection, with `time` parsed from their time stamps. Each batch
+    is removed from the old collection once copied, so a migration cut short
+    carries on at the next start; the old collection is dropped at the end.
+    `_id` isn't unique on a time-series collection, so events a cut short
+    batch already copied are looked up and skipped rather than copied again.
+    """
+    if LegacyCamera.name not in await LegacyCamera.database.list_collection_names():
+        return
+    if not await _claim_migration(LegacyCamera.name):
+        return
+
+    oldest = datetime.utcnow() - timedelta(days=CAMERA_TTL_DAYS)
+    while batch := await LegacyCamera.find().limit(CAMERA_MIGRATION_BATCH).to_list(length=None):
+        documents = []
+        for event in batch:
+            if not event.get('license_plate_number'):
+                continue
+            time_stamp = str(event.get('time_stamp') or '')
+            document = {"_id": str(event['_id']), "license_plate_number": str(event['license_plate_number']),
+                        "time_stamp": time_stamp, "time": parse_time_stamp(time_stamp, _inserted_at(event['_id']))}
+            # Past the retention it would only be expired again
+            if document['time'] > oldest:
+                documents.append(document)
+        if documents:
+            await _copy_events(documents)
+        await LegacyCamera.delete_many({"_id": {"$in": [event['_id'] for event in batch]}})
+        await Migrations.update_one({"_id": LegacyCamera.name}, {
+            "$set": {"lease_until": datetime.utcnow() + CAMERA_MIGRATION_LEASE},
+            "$inc": {"copied": len(documents)},
+        })
+
+    await LegacyCamera.drop()
+    await Migrations.update_one({"_id": LegacyCamera.name}, {"$set": {"done": True}})
+    logger.info("Copied the %s events into %s", LegacyCamera.name, Camera.name)
+
+
+class CameraWindow:
+    def __init__(self,
+                 plate: str | None = Query(default=None),
+                 since: datetime | None = Query(default=None, description="Events at or after, e.g. today's midnight"),
+                 until: datetime | None = Query(default=None)):
+        self.plate = plate
+        self.since = since
+        self.until = until
+
+    def query(self) -> dict | None:
+        query = {}
+        if self.plate is not None:
+            query['license_plate_number'] = self.plate
+        time_range = {}
+        if self.since is not None:
+            time_range['$gte'] = _utc(self.since)
+        if self.until is not None:
+            time_range['$lt'] = _utc(self.until)
+        if time_range:
+            query['time'] = time_range
+        return query or None
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def last_seen(plate: str) -> dict | None:
+    return await Camera.find_one({"license_plate_number": plate}, sort=[('time', -1)])
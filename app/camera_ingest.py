@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from app.background import BackgroundWorker
+from app.camera_dedup import PlateDeduplicator
+from app.camera_events import camera_document
+from app.mongo_client import Camera
+from models.camera_model import CameraModel
+
+CAMERA_BUFFER_SIZE = int(os.getenv('GARAGE_CAMERA_BUFFER_SIZE', 20000))
+CAMERA_FLUSH_SIZE = int(os.getenv('GARAGE_CAMERA_FLUSH_SIZE', 1000))
+CAMERA_FLUSH_INTERVAL = float(os.getenv('GARAGE_CAMERA_FLUSH_INTERVAL', 0.25))
+CAMERA_BATCH_MAX = int(os.getenv('GARAGE_CAMERA_BATCH_MAX', 5000))
+# Pause before retrying a failed flush, while events keep queueing up to the limit
+CAMERA_RETRY_DELAY = 1
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer(BackgroundWorker):
+    """
+    Holds accepted documents in memory and writes them with one insert_many
+    per flush. The buffer is bounded: once full, `offer` refuses new documents
+    and callers answer 503 so cameras back off instead of the worker growing
+    without limit while Mongo is slow or down.
+    """
+
+    def __init__(self, collection, max_size: int = CAMERA_BUFFER_SIZE,
+                 flush_size: int = CAMERA_FLUSH_SIZE, interval: float = CAMERA_FLUSH_INTERVAL):
+        super().__init__()
+        self._collection = collection
+        self._max_size = max_size
+        self._flush_size = flush_size
+        self._interval = interval
+        self._pending: deque[dict] = deque()
+        self.written = 0
+        self.rejected = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def has_room(self, count: int) -> bool:
+        return len(self._pending) + count <= self._max_size
+
+    def offer(self, documents: list[dict]) -> bool:
+        # All or nothing, so a rejected batch can be retried as a whole
+        if not self.has_room(len(documents)):
+            self.rejected += len(documents)
+            return False
+        self._pending.extend(documents)
+        self.wake()
+        return True
+
+    async def _drain(self) -> None:
+        # Write out whatever was accepted before shutdown
+        while self._pending:
+            if not await self._flush():
+                logger.error("Dropping %d buffered %s documents on shutdown",
+                             len(self._pending), self._collection.name)
+                self._pending.clear()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < self._flush_size:
+                await asyncio.sleep(self._interval)
+            self._wakeup.clear()
+            while self._pending:
+                if not await self._flush():
+                    await asyncio.sleep(CAMERA_RETRY_DELAY)
+
+    async def _flush(self) -> bool:
+        batch = [self._pending.popleft() for _ in range(min(self._flush_size, len(self._pending)))]
+        try:
+            await self._collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # The server went through the whole batch; rows it refused aren't
+            # retried
+            logger.warning("%d of %d %s documents not written: %s", len(e.details['writeErrors']), len(batch),
+                           self._collection.name, e.details['writeErrors'][:1])
+            self.written += e.details['nInserted']
+            return True
+        except asyncio.CancelledError:
+            # Stopping mid-write: keep the batch for the final flush
+            self._pending.extendleft(reversed(batch))
+            raise
+        except Exception:
+            logger.exception("Failed writing %d %s documents", len(batch), self._collection.name)
+            # Back at the front, in order, for the next attempt. `_id` isn't
+            # unique on a time-series collection, so rows of the batch that made
+            # it before the failure are written again
+            self._pending.extendleft(reversed(batch))
+            return False
+        self.written += len(batch)
+        return True
+
+    def describe(self) -> dict:
+        return {"depth": self.depth, "capacity": self._max_size,
+                "written": self.written, "rejected": self.rejected}
+
+
+camera_buffer = WriteBehindBuffer(Camera)
+camera_dedup = PlateDeduplicator(camera_buffer)
+
+
+def enqueue_camera_events(documents: list[dict]) -> list[dict]:
+    """
+    Queues reads for writing and returns the arrivals among them, the reads
+    that aren't repeats of a plate already in front of a camera.
+    """
+    if not camera_buffer.has_room(len(documents)):
+        camera_buffer.rejected += len(documents)
+        raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                            detail="Camera ingest buffer is full, retry shortly",
+                            headers={"Retry-After": str(max(1, round(CAMERA_FLUSH_INTERVAL)))})
+    return camera_dedup.observe(documents)
+
+
+def camera_documents(rows: list) -> tuple[list[dict], list[dict]]:
+    if len(rows) > CAMERA_BATCH_MAX:
+        raise HTTPException(status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {CAMERA_BATCH_MAX} events per request")
+
+    received = datetime.utcnow()
+    documents = []
+    errors = []
+    for row_number, row in enumerate(rows):
+        try:
+            event = CameraModel.parse_obj(row)
+        except ValidationError as e:
+            errors.append({"row": row_number, "status": "error", "detail": e.errors()})
+            continue
+        documents.append(camera_document(event, received))
+    return documents, errors
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import time
+
+from app.mongo_client import CARS
+
+CAR_TYPES_TTL = float(os.getenv('GARAGE_CAR_TYPES_TTL', 3600))
+
+
+class CarTypesCatalog:
+    """
+    Distinct {tozar, kinuy_mishari} pairs across the fleet. Loaded with one
+    $group aggregation, then kept current by `add` whenever enrichment writes
+    government data. The TTL reload picks up deletions and writes made by
+    other workers.
+    """
+
+    def __init__(self, collection, ttl: float = CAR_TYPES_TTL):
+        self._collection = collection
+        self._ttl = ttl
+        self._types: dict[tuple, dict] = {}
+        self._snapshot: list[dict] | None = None
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def _expired(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self._ttl
+
+    async def refresh(self) -> None:
+        pipeline = [
+            {"$match": {"government_data": {"$ne": None}}},
+            {"$group": {"_id": {"tozar": "$government_data.tozar",
+                                "kinuy_mishari": "$government_data.kinuy_mishari"}}},
+            {"$sort": {"_id.tozar": 1, "_id.kinuy_mishari": 1}},
+        ]
+        types = {}
+        async for group in self._collection.aggregate(pipeline):
+            car_type = {'tozar': group['_id'].get('tozar'),
+                        'kinuy_mishari': group['_id'].get('kinuy_mishari')}
+            types[(car_type['tozar'], car_type['kinuy_mishari'])] = car_type
+
+        self._types = types
+        self._snapshot = None
+        self._loaded_at = time.monotonic()
+
+    async def get(self) -> list[dict]:
+        if self._expired():
+            async with self._lock:
+                if self._expired():
+                    await self.refresh()
+
+        if self._snapshot is None:
+            self._snapshot = list(self._types.values())
+        return self._snapshot
+
+    def add(self, government_data: dict | None) -> None:
+        if not government_data or self._loaded_at is None:
+            return
+
+        key = (government_data.get('tozar'), government_data.get('kinuy_mishari'))
+        if key not in self._types:
+            self._types[key] = {'tozar': key[0], 'kinuy_mishari': key[1]}
+            self._snapshot = None
+
+
+car_types = CarTypesCatalog(CARS)
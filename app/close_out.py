@@ -0,0 +1,129 @@
+from collections import Counter
+from datetime import datetime
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from app.mongo_client import (client, ILLEGAL_OPERATION, CARS, CUSTOMERS, Area, Storage, Repairs, RepairsFinish,
+                              StockMovements)
+from app.stock import AMOUNT_IN_STOCK, READABLE_STOCK, stock_amount
+from models.repairs_finish import RepairFinishModel, FinishRepairModel
+from models.repairs_model import RepairProductModel
+from models.stock_movement_model import MovementKind, StockMovementModel
+
+
+def product_quantities(products: list[dict] | None) -> tuple[Counter, list[dict]]:
+    """
+    Totals the amount per storage item over the products of a repair, each a
+    RepairProductModel. Products that aren't are returned as skipped, with
+    their position and the reason, instead of guessing what they meant.
+    """
+    quantities = Counter()
+    skipped = []
+    for index, product in enumerate(products or []):
+        try:
+            parsed = RepairProductModel.parse_obj(product)
+        except ValidationError as e:
+            skipped.append({"index": index, "detail": e.errors()})
+            continue
+        quantities[parsed.item_id] += parsed.amount
+    return quantities, skipped
+
+
+async def build_snapshot(repair_id: str) -> dict | None:
+    # Car, customer and area are joined server-side in a single round trip
+    pipeline = [
+        {"$match": {"_id": repair_id}},
+        {"$lookup": {"from": CARS.name, "localField": "license_plate_number",
+                     "foreignField": "license_plate_number", "as": "_cars"}},
+        {"$lookup": {"from": CUSTOMERS.name, "localField": "license_plate_number",
+                     "foreignField": "cars", "as": "_customers"}},
+        {"$lookup": {"from": Area.name, "localField": "area_id",
+                     "foreignField": "_id", "as": "_areas"}},
+        {"$addFields": {
+            "car": {"$ifNull": [{"$arrayElemAt": ["$_cars", 0]}, "$car"]},
+            "customer": {"$arrayElemAt": ["$_customers", 0]},
+            "area": {"$ifNull": [{"$arrayElemAt": ["$_areas", 0]}, {}]},
+        }},
+        {"$project": {"_cars": 0, "_customers": 0, "_areas": 0}},
+    ]
+    snapshots = await Repairs.aggregate(pipeline).to_list(length=1)
+    return snapshots[0] if snapshots else None
+
+
+async def _commit(finished: dict, quantities: Counter, skipped: list[dict], session=None) -> list[dict]:
+    await RepairsFinish.insert_one(finished, session=session)
+
+    skipped = list(skipped)
+    movements = []
+    for item_id, amount in quantities.items():
+        # Finishing a repair never fails on a stock miscount, it stops at zero;
+        # stock that isn't a whole number is left for someone to fix
+        before = await Storage.find_one_and_update(
+            {"_id": item_id, "$expr": READABLE_STOCK},
+            [{"$set": {"amount_in_stock": {"$max": [0, {"$subtract": [AMOUNT_IN_STOCK, amount]}]}}}],
+            projection={"amount_in_stock": 1},
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if before is None:
+            exists = await Storage.count_documents({"_id": item_id}, limit=1, session=session)
+            skipped.append({"item_id": item_id, "amount": amount,
+                            "detail": "Stock isn't a whole number" if exists else "No such storage item"})
+            continue
+
+        in_stock = stock_amount(before['amount_in_stock'])
+        taken = min(amount, in_stock)
+        if taken < amount:
+            skipped.append({"item_id": item_id, "amount": amount - taken, "detail": "Not in stock"})
+        if taken == 0:
+            continue
+        # The ledger records what was actually taken, not what was asked for
+        movement = jsonable_encoder(StockMovementModel(item_id=item_id, kind=MovementKind.take, quantity=taken,
+                                                       repair_id=finished['_id'], amount_after=in_stock - taken))
+        movement['time_stamp'] = datetime.utcnow()
+        movements.append(movement)
+
+    if movements:
+        await StockMovements.insert_many(movements, session=session)
+    if skipped:
+        await RepairsFinish.update_one({"_id": finished['_id']}, {"$set": {"skipped_products": skipped}},
+                                       session=session)
+
+    await Repairs.delete_one({"_id": finished['_id']}, session=session)
+    return skipped
+
+
+async def finish_repair(repair_id: str, finish: FinishRepairModel) -> dict:
+    snapshot = await build_snapshot(repair_id)
+    if snapshot is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=f"repairs {repair_id} not found")
+
+    snapshot.update(finish.dict(exclude_none=True))
+    # The finished repair keeps the open repair's _id, so finishing twice conflicts
+    finished = jsonable_encoder(RepairFinishModel.parse_obj(snapshot))
+    quantities, skipped = product_quantities(finished.get('products'))
+
+    try:
+        async with await client.start_session() as session:
+            try:
+                async with session.start_transaction():
+                    skipped = await _commit(finished, quantities, skipped, session)
+            except OperationFailure as e:
+                if e.code != ILLEGAL_OPERATION:
+                    raise
+                # Standalone server: same writes, ordered so a retry is rejected
+                # by the duplicate _id before touching stock again
+                skipped = await _commit(finished, quantities, skipped)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT,
+                            detail=f"repairs {repair_id} already finished")
+
+    if skipped:
+        finished['skipped_products'] = skipped
+    return finished
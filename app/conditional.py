@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+from fastapi import Depends, Request, Response
+from pymongo import ReturnDocument
+
+from app.mongo_client import Versions
+from app.streaming import wants_ndjson
+
+REFERENCE_CACHE_CONTROL = os.getenv('GARAGE_REFERENCE_CACHE_CONTROL', 'no-cache')
+# How often other workers' writes are picked up
+VERSION_POLL = float(os.getenv('GARAGE_VERSION_POLL', 2))
+
+logger = logging.getLogger(__name__)
+
+
+class NotModified(Exception):
+    def __init__(self, headers: dict):
+        self.headers = headers
+
+
+class CollectionVersions:
+    """
+    Write counter per collection. The counters live in Mongo so every worker
+    sees every write, and each worker keeps a copy in memory so a conditional
+    GET can be answered without a round trip.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._versions: dict[str, int] = {}
+        self._loaded = False
+
+    def get(self, name: str) -> int | None:
+        # Unknown until the first load, so no ETag is handed out before then
+        if not self._loaded:
+            return None
+        return self._versions.get(name, 0)
+
+    async def bump(self, name: str, count: int = 1) -> int:
+        counter = await self._store.find_one_and_update(
+            {"_id": name}, {"$inc": {"version": count}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        self._versions[name] = max(self._versions.get(name, 0), counter['version'])
+        return counter['version']
+
+    async def load(self) -> None:
+        async for counter in self._store.find():
+            # Counters only grow; a slow read must not undo a bump made meanwhile
+            self._versions[counter['_id']] = max(self._versions.get(counter['_id'], 0), counter['version'])
+        self._loaded = True
+
+    async def keep_fresh(self, interval: float = VERSION_POLL) -> None:
+        while True:
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Failed loading collection versions")
+            await asyncio.sleep(interval)
+
+
+versions = CollectionVersions(Versions)
+
+
+def etag_for(version: int, request: Request) -> str:
+    # The same collection version renders differently per path, query and format
+    representation = f"{request.url.path}?{sorted(request.query_params.multi_items())}|{wants_ndjson(request)}"
+    digest = hashlib.blake2b(representation.encode(), digest_size=8).hexdigest()
+    return f'"{version}-{digest}"'
+
+
+def matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return '*' in tags or etag in tags
+
+
+def conditional_get(name: str):
+    """
+    Route dependency: answers 304 when the client already has the current
+    version, before the route queries Mongo or serializes anything.
+    """
+
+    async def check(request: Request, response: Response):
+        version = versions.get(name)
+        if version is None:
+            return
+
+        headers = {"ETag": etag_for(version, request), "Cache-Control": REFERENCE_CACHE_CONTROL}
+        if matches(request.headers.get('if-none-match'), headers['ETag']):
+            raise NotModified(headers)
+        response.headers.update(headers)
+
+    return Depends(check)
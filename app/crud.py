@@ -0,0 +1,45 @@
+from enum import Enum
+from http import HTTPStatus
+
+from fastapi import HTTPException, Query
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+
+
+class ReturnPreference(str, Enum):
+    representation = 'representation'
+    minimal = 'minimal'
+
+
+def return_preference(
+        preference: ReturnPreference = Query(default=ReturnPreference.representation, alias='return')
+) -> ReturnPreference:
+    return preference
+
+
+def created_response(document: dict, preference: ReturnPreference):
+    if preference == ReturnPreference.minimal:
+        # Bypasses the route's response_model, which expects the whole document
+        return JSONResponse(status_code=HTTPStatus.CREATED, content={"_id": str(document["_id"])})
+    return document
+
+
+async def insert_document(collection, document: dict, preference: ReturnPreference):
+    # The encoded document already carries its generated `_id`, so it is
+    # echoed back as is instead of being read again
+    await collection.insert_one(document)
+    return created_response(document, preference)
+
+
+async def update_document(collection, query: dict, new_values: dict, not_found_detail: str) -> dict:
+    # One round trip: a missing document comes back as None instead of
+    # needing a find_one before and after the update
+    updated = await collection.find_one_and_update(
+        query,
+        {"$set": new_values},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=not_found_detail)
+    return updated
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import os
+from typing import Callable
+
+from pymongo import UpdateOne
+
+from app.background import BackgroundWorker
+from app.car_catalog import car_types
+from app.gov_data import get_cars_info_from_gov_db
+from app.mongo_client import CARS
+
+ENRICH_BATCH_SIZE = int(os.getenv('GARAGE_ENRICH_BATCH_SIZE', 50))
+ENRICH_BATCH_WINDOW = float(os.getenv('GARAGE_ENRICH_BATCH_WINDOW', 0.5))
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentQueue(BackgroundWorker):
+    """
+    Collects cars waiting for government data for a short window and resolves
+    them together: one vehicle lookup per batch, one lookup per distinct model
+    and a single bulk_write for the results. Callables in `on_enriched` get
+    the plates of every batch written, e.g. to drop what was cached for them.
+    """
+
+    def __init__(self, batch_size: int = ENRICH_BATCH_SIZE, window: float = ENRICH_BATCH_WINDOW):
+        super().__init__()
+        self._batch_size = batch_size
+        self._window = window
+        self._pending: dict[str, set] = {}
+        self.on_enriched: list[Callable[..., None]] = []
+
+    def submit(self, car_oid, license_plate_number: str) -> None:
+        self._pending.setdefault(license_plate_number, set()).add(car_oid)
+        self.wake()
+
+    async def _drain(self) -> None:
+        # Don't lose cars accepted just before shutdown
+        while self._pending:
+            await self._flush()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if len(self._pending) < self._batch_size:
+                await asyncio.sleep(self._window)
+            self._wakeup.clear()
+            while self._pending:
+                await self._flush()
+
+    def _take_batch(self) -> dict[str, set]:
+        plates = list(self._pending)[:self._batch_size]
+        return {plate: self._pending.pop(plate) for plate in plates}
+
+    async def _flush(self) -> None:
+        batch = self._take_batch()
+        try:
+            results = await get_cars_info_from_gov_db(list(batch))
+            await CARS.bulk_write([
+                UpdateOne({"_id": car_oid}, {"$set": {"government_data": results[plate]}})
+                for plate, car_oids in batch.items()
+                for car_oid in car_oids
+            ], ordered=False)
+        except Exception:
+            logger.exception("Failed enriching cars %s", list(batch))
+            return
+
+        for government_data in results.values():
+            car_types.add(government_data)
+        for hook in self.on_enriched:
+            hook(*batch)
+
+
+enrichment_queue = EnrichmentQueue()
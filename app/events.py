@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import secrets
+from collections import deque
+from datetime import datetime
+from enum import Enum
+from itertools import islice
+
+from fastapi.responses import StreamingResponse
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from app.conditional import versions
+from app.fast_json import dumps
+from app.mongo_client import Events
+
+EVENTS_BACKLOG = int(os.getenv('GARAGE_EVENTS_BACKLOG', 1000))
+EVENTS_LOG_BYTES = int(os.getenv('GARAGE_EVENTS_LOG_BYTES', 16 * 1024 * 1024))
+# Comment lines sent to idle screens so proxies keep the connection open
+EVENTS_KEEPALIVE = float(os.getenv('GARAGE_EVENTS_KEEPALIVE', 15))
+EVENTS_RETRY_DELAY = 1
+
+EVENT_STREAM_MEDIA_TYPE = 'text/event-stream'
+
+logger = logging.getLogger(__name__)
+
+
+class EventTopic(str, Enum):
+    camera = 'camera'
+    repairs = 'repairs'
+
+
+class Broadcaster:
+    """
+    Fans events out to the push streams of this worker. Events are kept in a
+    bounded ring in memory; a subscriber only holds its position in the ring
+    and waits for the next delivery, so idle screens cost a parked coroutine.
+
+    Published events are written to a capped collection that every worker
+    tails, so a screen sees writes made on any worker, and event ids are a
+    shared sequence a reconnecting screen can resume from on any worker.
+    Servers that can't tail it (no capped collections) fall back to
+    delivering on the publishing worker only.
+    """
+
+    def __init__(self, log, backlog: int = EVENTS_BACKLOG):
+        self._log = log
+        self._ring: deque[dict] = deque(maxlen=backlog)
+        # Events delivered since start, the position subscribers count in
+        self._delivered = 0
+        self._changed = asyncio.Event()
+        self._local_ids = f"{secrets.token_hex(4)}-"
+        self._pending: set[asyncio.Task] = set()
+        self._task: asyncio.Task | None = None
+        self.shared = False
+
+    def publish(self, event: str, documents: list[dict]) -> None:
+        if not documents:
+            return
+        if not self.shared:
+            self._deliver_locally(event, documents)
+            return
+        task = asyncio.create_task(self._append(event, documents))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _append(self, event: str, documents: list[dict]) -> None:
+        try:
+            # Ids are reserved up front so one batch takes a single round trip
+            last = await versions.bump(self._log.name, len(documents))
+            at = datetime.utcnow()
+            await self._log.insert_many([
+                {"seq": seq, "event": event, "data": document, "at": at}
+                for seq, document in zip(range(last - len(documents) + 1, last + 1), documents)
+            ], ordered=True)
+        except PyMongoError:
+            logger.exception("Failed logging %d %s events, delivering on this worker only", len(documents), event)
+            self._deliver_locally(event, documents)
+
+    def _deliver_locally(self, event: str, documents: list[dict]) -> None:
+        for document in documents:
+            self._deliver(f"{self._local_ids}{self._delivered + 1}", event, document)
+
+    def _deliver(self, event_id: str, event: str, data: dict) -> None:
+        self._ring.append({"id": event_id, "event": event, "topic": event.split('.')[0], "data": data})
+        self._delivered += 1
+        # Wakes every waiting subscriber at once; the next ones wait on a new event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def start(self) -> None:
+        try:
+            await self._log.database.create_collection(self._log.name, capped=True, size=EVENTS_LOG_BYTES)
+        except CollectionInvalid:
+            pass  # Already there, from an earlier start
+        except PyMongoError as e:
+            logger.warning("Events log unavailable (%s), pushing events per worker", e)
+            return
+
+        try:
+            options = await self._log.options()
+            # Only events logged from now on are delivered
+            last = await self._log.find_one(sort=[('$natural', -1)], projection={"_id": 1})
+        except PyMongoError as e:
+            logger.warning("Events log unavailable (%s), pushing events per worker", e)
+            return
+        if not options.get('capped'):
+            logger.warning("%s isn't a capped collection, pushing events per worker", self._log.name)
+            return
+
+        self.shared = True
+        self._task = asyncio.create_task(self._tail(last['_id'] if last is not None else None))
+
+    async def _tail(self, after) -> None:
+        """
+        Delivers the log in insertion order, after the entry with `_id` after.
+        Sequence numbers are reserved before inserting, so two workers can log
+        them out of order; resuming by position rather than by sequence means
+        a late insert with a lower number is still delivered.
+        """
+        while True:
+            try:
+                if after is not None and await self._log.find_one({"_id": after}, projection={"_id": 1}) is None:
+                    # Rolled out of the capped log, everything still in it is newer
+                    logger.warning("Events log overtook this worker, some events were not pushed")
+                    after = None
+                skipping = after is not None
+                cursor = self._log.find(cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for entry in cursor:
+                        if skipping:
+                            skipping = entry['_id'] != after
+                            continue
+                        after = entry['_id']
+                        self._deliver(str(entry['seq']), entry['event'], entry['data'])
+            except PyMongoError:
+                logger.exception("Lost the events log, tailing again")
+            # A tailable cursor on an empty log, or one that lost its place, is closed by the server
+            await asyncio.sleep(EVENTS_RETRY_DELAY)
+
+    async def stop(self) -> None:
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _position_after(self, event_id: str | None) -> int | None:
+        if event_id is None:
+            return self._delivered
+        for offset, entry in enumerate(reversed(self._ring)):
+            if entry['id'] == event_id:
+                return self._delivered - offset
+        return None
+
+    async def subscribe(self, topics: set[str], last_event_id: str | None = None):
+        position = self._position_after(last_event_id)
+        if position is None:
+            # Resuming from an event that's no longer kept, the screen has to reload
+            yield {"event": "reset", "data": {"last_event_id": last_event_id}}
+            position = self._delivered
+
+        while True:
+            if position == self._delivered:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield None
+                continue
+
+            missed = self._delivered - position
+            if missed > len(self._ring):
+                # Fell behind further than the backlog
+                yield {"event": "reset", "data": {}}
+                missed = len(self._ring)
+            position = self._delivered
+            # Newest first, so catching up costs the missed events, not the backlog
+            for entry in reversed(list(islice(reversed(self._ring), missed))):
+                if entry['topic'] in topics:
+                    yield entry
+
+    def describe(self) -> dict:
+        return {"shared": self.shared, "delivered": self._delivered, "backlog": len(self._ring),
+                "publishing": len(self._pending)}
+
+
+def sse_message(entry: dict | None) -> bytes:
+    if entry is None:
+        return b': keep-alive\n\n'
+    lines = [f"event: {entry['event']}"]
+    if 'id' in entry:
+        lines.append(f"id: {entry['id']}")
+    return '\n'.join(lines).encode() + b'\ndata: ' + dumps(entry['data']) + b'\n\n'
+
+
+async def _iterate_sse(stream):
+    # Tells EventSource how long to wait before reconnecting
+    yield f"retry: {EVENTS_RETRY_DELAY * 1000}\n\n".encode()
+    async for entry in stream:
+        yield sse_message(entry)
+
+
+def event_stream(topics: list[EventTopic], last_event_id: str | None = None) -> StreamingResponse:
+    stream = broadcaster.subscribe({topic.value for topic in topics}, last_event_id)
+    return StreamingResponse(_iterate_sse(stream), media_type=EVENT_STREAM_MEDIA_TYPE,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+broadcaster = Broadcaster(Events)
@@ -0,0 +1,76 @@
+import os
+from functools import lru_cache
+
+import orjson
+from bson import ObjectId
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.projection import model_defaults, with_defaults
+
+# List routes encode Mongo documents directly instead of validating each one
+# through the response model; set to 0 to go back to the validated path
+TRUSTED_READS = os.getenv('GARAGE_TRUSTED_READS', '1') == '1'
+
+# Headers of the injected response that don't carry over to the returned one
+SKIPPED_HEADERS = {'content-length', 'content-type'}
+
+
+def _default(value):
+    # Same conversion as the models' json_encoders
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def _keys(model: type[BaseModel]) -> tuple[str, ...]:
+    return tuple(field.alias for field in model.__fields__.values())
+
+
+def trusted_document(model: type[BaseModel], document: dict, fields: list[str] | None) -> dict:
+    """
+    What the response model would have sent for `document`, without
+    validating it: unknown keys dropped and, unless the response is
+    projected, missing fields filled with their defaults.
+    """
+    defaults = {} if fields else model_defaults(model)
+    shaped = {}
+    # Model order, as the validated path would send it
+    for key in _keys(model):
+        if key in document:
+            shaped[key] = document[key]
+        elif key in defaults:
+            shaped[key] = defaults[key]
+    return shaped
+
+
+def inherited_headers(response: Response) -> dict:
+    # Headers set on the injected response (ETag, paging cursor, ...) are lost
+    # when a route returns its own response, unless copied over
+    return {key: value for key, value in response.headers.items() if key not in SKIPPED_HEADERS}
+
+
+def documents_response(documents: list[dict], response: Response) -> FastJSONResponse:
+    # Returning a response skips the route's response_model, which still
+    # documents the schema
+    return FastJSONResponse(documents, headers=inherited_headers(response))
+
+
+def document_response(model: type[BaseModel], document: dict, fields: list[str] | None, response: Response):
+    # Item routes shape a document like list routes do, so both send the same
+    # values; validating through the response model would coerce union fields
+    # such as `str | int` differently
+    if not TRUSTED_READS:
+        return with_defaults(model, document, fields)
+    return FastJSONResponse(trusted_document(model, document, fields), headers=inherited_headers(response))
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+import aiohttp
+from pymongo import ReplaceOne, UpdateOne
+
+from app.http_client import get_http_session
+from app.mongo_client import GovVehiclesCache, GovModelsCache, GovVehicleSources
+
+GOV_API_URL = 'https://data.gov.il/api/3/action/datastore_search'
+VEHICLES_RESOURCE_ID = '053cea08-09bc-40ec-8f7a-156f0677aff3'
+MODELS_RESOURCE_ID = '5e87a7a1-2f6f-41c1-8aec-7216d52a6cf6'
+# Plates missing from the main registry may be in one of these
+FALLBACK_RESOURCE_IDS = [
+    '03adc637-b6fe-402b-9937-7c3d3afc9140',
+    'cd3acc5c-03c3-4c89-9c54-d40f93c0d790',
+    '851ecab1-0622-4dbe-a6c7-f950cf82abf9',  # vehicles taken off the road
+]
+OFF_ROAD_RESOURCE_ID = FALLBACK_RESOURCE_IDS[-1]
+
+GOV_CACHE_TTL = timedelta(seconds=int(os.getenv('GARAGE_GOV_CACHE_TTL', 30 * 24 * 3600)))
+GOV_NEGATIVE_CACHE_TTL = timedelta(seconds=int(os.getenv('GARAGE_GOV_NEGATIVE_CACHE_TTL', 24 * 3600)))
+# data.gov.il certificates have failed verification before; only these calls skip it
+GOV_VERIFY_SSL = os.getenv('GARAGE_GOV_VERIFY_SSL', '0') == '1'
+GOV_FALLBACK_CONCURRENCY = int(os.getenv('GARAGE_GOV_FALLBACK_CONCURRENCY', len(FALLBACK_RESOURCE_IDS)))
+
+logger = logging.getLogger(__name__)
+_fallback_slots = asyncio.Semaphore(GOV_FALLBACK_CONCURRENCY)
+
+
+class LookupCache:
+    """
+    Mongo-backed cache for data.gov.il records. A `None` value is cached too
+    (negative caching), with its own shorter TTL so new registrations show up.
+    Expired entries are removed by the TTL index on `expires_at`.
+    """
+
+    def __init__(self, collection, ttl: timedelta = GOV_CACHE_TTL,
+                 negative_ttl: timedelta = GOV_NEGATIVE_CACHE_TTL):
+        self._collection = collection
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+
+    async def get_many(self, keys: list[str]) -> dict[str, dict | None]:
+        # The TTL monitor only runs once a minute, so check expiry here as well
+        cursor = self._collection.find(
+            {"_id": {"$in": keys}, "expires_at": {"$gt": datetime.utcnow()}}
+        )
+        return {entry['_id']: entry['value'] async for entry in cursor}
+
+    async def set_many(self, values: dict[str, dict | None]) -> None:
+        if not values:
+            return
+
+        now = datetime.utcnow()
+        await self._collection.bulk_write([
+            ReplaceOne(
+                {"_id": key},
+                {"value": value,
+                 "expires_at": now + (self._ttl if value is not None else self._negative_ttl)},
+                upsert=True
+            )
+            for key, value in values.items()
+        ], ordered=False)
+
+
+vehicles_cache = LookupCache(GovVehiclesCache)
+models_cache = LookupCache(GovModelsCache)
+
+
+def model_key(vehicle: dict) -> tuple[str, str, str] | None:
+    # Not every fallback resource carries the model codes
+    if any(vehicle.get(field) is None for field in ('tozeret_cd', 'degem_cd', 'shnat_yitzur')):
+        return None
+    return (str(vehicle['tozeret_cd']).zfill(4),
+            str(vehicle['degem_cd']).zfill(4),
+            str(vehicle['shnat_yitzur']))
+
+
+def plate_key(license_plate_number) -> str:
+    # mispar_rechev comes back as a number, so compare without leading zeros
+    return str(license_plate_number).lstrip('0')
+
+
+async def datastore_search(session: aiohttp.ClientSession, resource_id: str, filters: dict,
+                           limit: int = 2) -> list[dict]:
+    async with session.post(
+            url=GOV_API_URL,
+            ssl=None if GOV_VERIFY_SSL else False,
+            json={
+                "resource_id": resource_id,
+                "filters": filters,
+                "limit": limit,
+                "offset": 0
+            }
+    ) as response:
+        return (await response.json())['result']['records']
+
+
+async def _search_plates(session: aiohttp.ClientSession, resource_id: str,
+                         license_plate_numbers: list[str]) -> dict[str, dict]:
+    # The filter takes a list, so any number of plates costs a single request
+    records = await datastore_search(session, resource_id, {"mispar_rechev": license_plate_numbers},
+                                     limit=2 * len(license_plate_numbers))
+    found = {}
+    for record in records:
+        found.setdefault(plate_key(record['mispar_rechev']), record)
+    return {plate: found[plate_key(plate)] for plate in license_plate_numbers
+            if plate_key(plate) in found}
+
+
+async def _search_fallbacks(session: aiohttp.ClientSession,
+                            license_plate_numbers: list[str]) -> tuple[dict[str, tuple[str, dict]], bool]:
+    """
+    Returns the hit per plate from the first fallback, in FALLBACK_RESOURCE_IDS
+    order, that has it, and whether every fallback answered, i.e. whether the
+    plates left out are really unknown.
+    """
+    async def search(resource_id: str):
+        try:
+            async with _fallback_slots:
+                return resource_id, await _search_plates(session, resource_id, license_plate_numbers)
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+            logger.warning("Fallback vehicle lookup in %s failed: %r", resource_id, e)
+            return resource_id, None
+
+    def pick(answered: dict[str, dict], plate: str) -> tuple[bool, tuple[str, dict] | None]:
+        # Decided once every resource ahead of the hit has answered without it
+        for resource_id in FALLBACK_RESOURCE_IDS:
+            if resource_id not in answered:
+                return False, None
+            if plate in answered[resource_id]:
+                return True, (resource_id, answered[resource_id][plate])
+        return True, None
+
+    # Query every fallback at once instead of paying for each resource in turn;
+    # the lower ones are cancelled once every plate is decided
+    tasks = [asyncio.create_task(search(resource_id)) for resource_id in FALLBACK_RESOURCE_IDS]
+    answered = {}
+    complete = True
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            resource_id, found = await next_done
+            if found is None:
+                complete = False
+            answered[resource_id] = found or {}
+            picks = {plate: pick(answered, plate) for plate in license_plate_numbers}
+            if all(decided for decided, _ in picks.values()):
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return {plate: hit for plate, (_, hit) in picks.items() if hit is not None}, complete
+
+
+async def get_vehicles(session: aiohttp.ClientSession,
+                       license_plate_numbers: list[str]) -> dict[str, dict | None]:
+    vehicles = await vehicles_cache.get_many(license_plate_numbers)
+    missing = [plate for plate in license_plate_numbers if plate not in vehicles]
+    if not missing:
+        return vehicles
+
+    # Plates previously answered by a fallback resource go straight there
+    sources = {source['_id']: source['resource_id']
+               async for source in GovVehicleSources.find({"_id": {"$in": missing}})}
+    by_resource: dict[str, list[str]] = {}
+    for plate in missing:
+        by_resource.setdefault(sources.get(plate, VEHICLES_RESOURCE_ID), []).append(plate)
+
+    answered: dict[str, tuple[str, dict]] = {}
+    results = await asyncio.gather(*(_search_plates(session, resource_id, plates)
+                                     for resource_id, plates in by_resource.items()))
+    for resource_id, found in zip(by_resource, results):
+        for plate, record in found.items():
+            answered[plate] = (resource_id, record)
+
+    # A plate may have come back to the main registry since its fallback answered
+    returned = [plate for plate in missing if plate not in answered
+                and sources.get(plate, VEHICLES_RESOURCE_ID) != VEHICLES_RESOURCE_ID]
+    if returned:
+        for plate, record in (await _search_plates(session, VEHICLES_RESOURCE_ID, returned)).items():
+            answered[plate] = (VEHICLES_RESOURCE_ID, record)
+
+    unresolved = [plate for plate in missing if plate not in answered]
+    complete = True
+    if unresolved:
+        found, complete = await _search_fallbacks(session, unresolved)
+        answered |= found
+
+    for plate, (resource_id, _) in answered.items():
+        if resource_id == OFF_ROAD_RESOURCE_ID:
+            logger.warning("Car %s was taken off the road", plate)
+
+    changed_sources = [(plate, resource_id) for plate, (resource_id, _) in answered.items()
+                       if resource_id != sources.get(plate, VEHICLES_RESOURCE_ID)]
+    if changed_sources:
+        await GovVehicleSources.bulk_write([
+            UpdateOne({"_id": plate}, {"$set": {"resource_id": resource_id}}, upsert=True)
+            for plate, resource_id in changed_sources
+        ], ordered=False)
+
+    fetched = {plate: answered[plate][1] if plate in answered else None for plate in missing}
+    # A plate a failed fallback might have known isn't cached as not found
+    await vehicles_cache.set_many(fetched if complete else
+                                  {plate: vehicle for plate, vehicle in fetched.items() if vehicle is not None})
+    return vehicles | fetched
+
+
+async def _fetch_model(session: aiohttp.ClientSession, key: tuple[str, str, str]) -> dict | None:
+    tozeret_cd, degem_cd, shnat_yitzur = key
+    records = await datastore_search(session, MODELS_RESOURCE_ID, {
+        "tozeret_cd": [tozeret_cd],
+        "degem_cd": [degem_cd],
+        "shnat_yitzur": [shnat_yitzur]
+    })
+    return records[0] if records else None
+
+
+async def get_models(session: aiohttp.ClientSession,
+                     keys: set[tuple[str, str, str]]) -> dict[tuple[str, str, str], dict | None]:
+    cache_keys = {':'.join(key): key for key in keys}
+    cached = await models_cache.get_many(list(cache_keys))
+    models = {cache_keys[cache_key]: value for cache_key, value in cached.items()}
+
+    # Filters are ANDed per field, so each distinct model needs its own request
+    missing = [key for key in keys if key not in models]
+    fetched = dict(zip(missing, await asyncio.gather(*(_fetch_model(session, key) for key in missing))))
+    await models_cache.set_many({':'.join(key): value for key, value in fetched.items()})
+    return models | fetched
+
+
+async def get_cars_info_from_gov_db(license_plate_numbers: list[str]) -> dict[str, dict | None]:
+    session = get_http_session()
+    vehicles = await get_vehicles(session, license_plate_numbers)
+    models = await get_models(session, {model_key(vehicle) for vehicle in vehicles.values()
+                                        if vehicle is not None} - {None})
+
+    results = {}
+    for plate in license_plate_numbers:
+        vehicle = vehicles.get(plate)
+        if vehicle is None:
+            logger.info("Car not found in gov db %s", plate)
+            results[plate] = None
+            continue
+        # Fallback records often lack the model codes, the vehicle alone still helps
+        model = models.get(model_key(vehicle))
+        results[plate] = {**model, **vehicle} if model is not None else vehicle
+    return results
+
+
+async def get_car_info_from_gov_db(license_plate_number: str):
+    return (await get_cars_info_from_gov_db([license_plate_number]))[license_plate_number]
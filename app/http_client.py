@@ -0,0 +1,41 @@
+import os
+
+import aiohttp
+
+HTTP_POOL_LIMIT = int(os.getenv('GARAGE_HTTP_POOL_LIMIT', 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('GARAGE_HTTP_POOL_LIMIT_PER_HOST', 20))
+HTTP_DNS_CACHE_TTL = int(os.getenv('GARAGE_HTTP_DNS_CACHE_TTL', 300))
+HTTP_TIMEOUT = float(os.getenv('GARAGE_HTTP_TIMEOUT', 15))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('GARAGE_HTTP_CONNECT_TIMEOUT', 5))
+
+# One pooled session per worker, shared by every outbound integration
+_session: aiohttp.ClientSession | None = None
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, sock_connect=HTTP_CONNECT_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    global _session
+    # Created lazily as well, for callers running outside the app lifecycle
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+
+async def open_http_session() -> None:
+    get_http_session()
+
+
+async def close_http_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
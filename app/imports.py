@@ -0,0 +1,212 @@
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from enum import Enum
+from http import HTTPStatus
+from itertools import islice
+
+from bson import ObjectId
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from app.bulk import validate_rows, bulk_upsert
+from app.mongo_client import ImportJobs
+
+IMPORT_CHUNK_SIZE = int(os.getenv('GARAGE_IMPORT_CHUNK_SIZE', 1000))
+IMPORT_MAX_ERRORS = int(os.getenv('GARAGE_IMPORT_MAX_ERRORS', 1000))
+
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+logger = logging.getLogger(__name__)
+
+# Keeps running imports referenced until they finish
+_running: set[asyncio.Task] = set()
+
+
+class ImportFormat(str, Enum):
+    csv = 'csv'
+    xlsx = 'xlsx'
+
+
+def import_request_body() -> dict:
+    # The body is read straight from the request stream, so describe it for the docs here
+    binary = {"schema": {"type": "string", "format": "binary"}}
+    return {"requestBody": {"required": True, "content": {"text/csv": binary, XLSX_MEDIA_TYPE: binary}}}
+
+
+def parse_mapping(mapping: str | None, model: type[BaseModel]) -> dict[str, str]:
+    if not mapping:
+        return {}
+    try:
+        parsed = json.loads(mapping)
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, dict) or not all(isinstance(v, str) for v in parsed.values()):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail='mapping must be a JSON object of {"column": "field"}')
+    # parse_obj would drop an unknown field, and the whole column with it
+    known = set(model.__fields__) | {field.alias for field in model.__fields__.values()}
+    unknown = sorted(set(parsed.values()) - known)
+    if unknown:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f"mapping targets unknown fields {', '.join(unknown)}")
+    return parsed
+
+
+def check_encoding(encoding: str) -> str:
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail=f"Unknown encoding {encoding}")
+    return encoding
+
+
+def detect_format(request: Request, import_format: ImportFormat | None) -> ImportFormat:
+    if import_format is not None:
+        return import_format
+    if XLSX_MEDIA_TYPE in request.headers.get('content-type', ''):
+        return ImportFormat.xlsx
+    return ImportFormat.csv
+
+
+async def spool_upload(request: Request):
+    # Uploads go to disk so memory stays flat whatever the file size
+    upload = tempfile.TemporaryFile()
+    async for chunk in request.stream():
+        await run_in_threadpool(upload.write, chunk)
+    upload.seek(0)
+    return upload
+
+
+def _csv_rows(upload, encoding: str):
+    yield from csv.reader(codecs.iterdecode(upload, encoding))
+
+
+def _cell(value):
+    # Excel stores numeric barcodes and amounts as floats
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _xlsx_rows(upload):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(upload, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def map_rows(rows, mapping: dict[str, str], model: type[BaseModel], defaults: dict):
+    """
+    Turns the raw rows of a file into (line number, dict of `model` fields)
+    pairs. The first row is the header. Columns are matched to fields by
+    `mapping` (column -> field) or by the field name itself, ignoring case;
+    other columns and blank rows are dropped. Empty cells are left out, so an
+    upsert keeps what the item already holds for them.
+    """
+    fields = {name.lower(): name for name in model.__fields__}
+    mapping = {column.strip().lower(): field for column, field in mapping.items()}
+
+    header = next(rows, None)
+    if header is None:
+        return
+
+    columns = []
+    for column in header:
+        column = str(column or '').strip().lower()
+        columns.append(mapping.get(column, fields.get(column)))
+
+    for line_number, row in enumerate(rows, start=2):
+        item = dict(defaults)
+        for field, value in zip(columns, row):
+            if isinstance(value, str):
+                value = value.strip()
+            if field is None or value is None or value == '':
+                continue
+            item[field] = value
+        if len(item) > len(defaults):
+            yield line_number, item
+
+
+def chunked(items, size: int):
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+async def create_job(collection_name: str, filename: str | None) -> dict:
+    job = {
+        "_id": str(ObjectId()),
+        "collection": collection_name,
+        "filename": filename,
+        "status": "running",
+        "rows": 0,
+        "inserted": 0,
+        "updated": 0,
+        "failed": 0,
+        "errors": [],
+        "created_at": datetime.utcnow(),
+        "finished_at": None,
+    }
+    await ImportJobs.insert_one(job)
+    return job
+
+
+async def _run_import(job_id: str, upload, rows, model: type[BaseModel], collection, upsert_on_barcode: bool,
+                      on_done=None):
+    chunks = chunked(rows, IMPORT_CHUNK_SIZE)
+    try:
+        while True:
+            # Parsing touches the spooled file, keep it off the event loop
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+
+            line_numbers, items = zip(*chunk)
+            documents, errors = validate_rows(model, list(items), row_numbers=list(line_numbers))
+            results = errors + await bulk_upsert(collection, documents, upsert_on_barcode=upsert_on_barcode)
+
+            failed = [result for result in results if result['status'] == 'error']
+            await ImportJobs.update_one({"_id": job_id}, {
+                "$inc": {
+                    "rows": len(chunk),
+                    "inserted": sum(result['status'] == 'inserted' for result in results),
+                    "updated": sum(result['status'] == 'updated' for result in results),
+                    "failed": len(failed),
+                },
+                "$push": {"errors": {"$each": failed, "$slice": IMPORT_MAX_ERRORS}},
+            })
+
+        await ImportJobs.update_one({"_id": job_id}, {
+            "$set": {"status": "done", "finished_at": datetime.utcnow()}
+        })
+        if on_done is not None:
+            on_done()
+    except Exception as e:
+        logger.exception("Import %s failed", job_id)
+        await ImportJobs.update_one({"_id": job_id}, {
+            "$set": {"status": "failed", "detail": str(e), "finished_at": datetime.utcnow()}
+        })
+    finally:
+        upload.close()
+
+
+def start_import(job: dict, upload, import_format: ImportFormat, encoding: str, mapping: dict[str, str],
+                 defaults: dict, model: type[BaseModel], collection, upsert_on_barcode: bool = False,
+                 on_done=None) -> None:
+    raw_rows = _xlsx_rows(upload) if import_format == ImportFormat.xlsx else _csv_rows(upload, encoding)
+    rows = map_rows(raw_rows, mapping, model, defaults)
+
+    task = asyncio.create_task(_run_import(job["_id"], upload, rows, model, collection, upsert_on_barcode, on_done))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
@@ -0,0 +1,38 @@
+import logging
+
+from pymongo.errors import PyMongoError
+
+from app.mongo_client import COLLECTIONS, INDEXES
+
+logger = logging.getLogger(__name__)
+
+# Outcome of the last bootstrap per collection, reported by /diagnostics/indexes
+index_status: dict[str, dict] = {}
+
+
+async def ensure_indexes() -> None:
+    # create_indexes is a no-op for indexes that already exist with the same
+    # spec, so every worker can run this on startup
+    for name, indexes in INDEXES.items():
+        if not indexes:
+            continue
+
+        try:
+            created = await COLLECTIONS[name].create_indexes(indexes)
+            index_status[name] = {'ok': True, 'indexes': created}
+        except PyMongoError as e:
+            # e.g. duplicate license plates blocking the unique index - keep serving
+            logger.error("Failed creating indexes on %s: %s", name, e)
+            index_status[name] = {'ok': False, 'error': str(e)}
+
+
+async def describe_indexes() -> dict:
+    report = {}
+    for name, indexes in INDEXES.items():
+        existing = await COLLECTIONS[name].index_information()
+        report[name] = {
+            'declared': [index.document['name'] for index in indexes],
+            'existing': sorted(existing),
+            'bootstrap': index_status.get(name),
+        }
+    return report
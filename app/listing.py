@@ -0,0 +1,44 @@
+from fastapi import Depends, Request, Response
+from pydantic import BaseModel
+
+from app.fast_json import TRUSTED_READS, trusted_document, documents_response, inherited_headers
+from app.pagination import PageParams, paginate, keyset_filter
+from app.projection import requested_fields, fields_projection, with_defaults
+from app.reference_cache import reference_cache
+from app.streaming import wants_ndjson, stream_ndjson
+
+
+class ListParams:
+    def __init__(self, request: Request, page: PageParams = Depends(),
+                 fields: list[str] | None = Depends(requested_fields)):
+        self.request = request
+        self.page = page
+        self.fields = fields
+
+    @property
+    def stream(self) -> bool:
+        return wants_ndjson(self.request)
+
+
+async def list_documents(collection, response: Response, params: ListParams,
+                         query: dict | None = None, model: type[BaseModel] | None = None,
+                         sort_key: str = '_id'):
+    projection = fields_projection(model, params.fields) if model is not None else None
+    if params.stream:
+        # Streams honour `after`/`limit` too, so an interrupted dump can resume
+        query = keyset_filter(query or {}, sort_key, params.page.after)
+        sort = [('_id', 1)] if sort_key == '_id' else [(sort_key, 1), ('_id', 1)]
+        return stream_ndjson(collection, query, sort=sort, limit=params.page.limit,
+                             projection=projection, headers=inherited_headers(response),
+                             model=model, fields=params.fields)
+
+    if query is None and projection is None and not params.page.enabled and reference_cache.caches(collection):
+        documents = await reference_cache.documents(collection)
+    else:
+        documents = await paginate(collection, response, params.page, query, sort_key, projection=projection)
+    if model is None:
+        return documents
+    if TRUSTED_READS:
+        return documents_response([trusted_document(model, document, params.fields) for document in documents],
+                                  response)
+    return [with_defaults(model, document, params.fields) for document in documents]
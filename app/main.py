@@ -1,21 +1,47 @@
+import asyncio
 from http import HTTPStatus
 
-import aiohttp
-from fastapi import FastAPI, HTTPException, Body, BackgroundTasks, Header
+from fastapi import FastAPI, HTTPException, Body, BackgroundTasks, Header, Depends, Response, Request, Query
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from pymongo.errors import DuplicateKeyError, OperationFailure
 
 from models.car_model import CarModel, UpdateCarModel
 from models.customer_model import CustomerModel, UpdateCustomerModel
 from models.supplier_model import SupplierModel, UpdateSupplierModel
-from app.mongo_client import CUSTOMERS, SUPPLIER, CARS, Storage, Used, Tools, Tipul, TipulGroup, Repairs, RepairsFinish, Area, Camera, Category, CategoryTools, ErrorCode
+from app.arrivals import arrival_cache
+from app.autocomplete import AUTOCOMPLETE_MAX_LIMIT, AutocompleteKind, autocomplete, keep_indexes_fresh, \
+    customers_index, storage_index
+from app.bulk import bulk_request_body, read_bulk_rows, validate_rows, bulk_upsert, summarize
+from app.camera_events import CameraWindow, camera_document, ensure_camera_collection, last_seen
+from app.camera_ingest import camera_buffer, camera_dedup, camera_documents, enqueue_camera_events
+from app.car_catalog import car_types
+from app.close_out import finish_repair
+from app.conditional import NotModified, conditional_get, versions
+from app.crud import ReturnPreference, return_preference, created_response, insert_document, update_document
+from app.enrichment import enrichment_queue
+from app.events import EventTopic, broadcaster, event_stream
+from app.fast_json import document_response
+from app.http_client import open_http_session, close_http_session
+from app.imports import ImportFormat, import_request_body, detect_format, parse_mapping, check_encoding, \
+    spool_upload, create_job, start_import
+from app.indexes import ensure_indexes, describe_indexes
+from app.listing import ListParams, list_documents
+from app.pagination import NEXT_CURSOR_HEADER
+from app.projection import requested_fields, fields_projection, partial_model
+from app.reference_cache import reference_cache
+from app.search import SEARCH_MAX_LIMIT, SearchCollection, search
+from app.stock import apply_movement, apply_movements
+from app.mongo_client import CUSTOMERS, SUPPLIER, CARS, Storage, Used, Tools, Tipul, TipulGroup, Repairs, RepairsFinish, Area, Camera, Category, CategoryTools, ErrorCode, ImportJobs, StockMovements
 from models.item_model import ItemModel, UpdateItemModel
+from models.stock_movement_model import StockMovementModel
 from models.used_model import UsedModel, UpdateUsedModel
 from models.tools_model import ToolsModel, UpdateToolsModel
 from models.tipulim_modal import TipulModel, UpdateTipulModel
 from models.tipulim_group_modal import TipulGroupModel, UpdateTipulGroupModel
 from models.repairs_model import RepairModel, UpdateRepairModel
-from models.repairs_finish import RepairFinishModel
+from models.repairs_finish import RepairFinishModel, FinishRepairModel
 from models.error_code_model import ErrorCodeModel
 from models.area_model import AreaModel, UpdateAreaModel
 from models.camera_model import CameraModel, UpdateCameraModel
@@ -37,9 +63,79 @@ app.add_middleware(
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"]
 )
 
+
+@app.exception_handler(NotModified)
+async def not_modified(request: Request, exc: NotModified):
+    return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=exc.headers)
+
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    # Index builds can take a while on big collections, don't hold up startup
+    app.state.index_bootstrap = asyncio.create_task(ensure_indexes())
+
+
+@app.on_event("startup")
+async def bootstrap_camera_collection():
+    app.state.camera_bootstrap = asyncio.create_task(ensure_camera_collection())
+
+
+@app.on_event("startup")
+async def startup_autocomplete():
+    app.state.autocomplete_refresh = asyncio.create_task(keep_indexes_fresh())
+
+
+@app.on_event("startup")
+async def startup_collection_versions():
+    app.state.versions_refresh = asyncio.create_task(versions.keep_fresh())
+
+
+@app.on_event("startup")
+async def startup_reference_cache():
+    app.state.reference_watch = asyncio.create_task(reference_cache.watch())
+
+
+@app.on_event("startup")
+async def startup_http_session():
+    await open_http_session()
+
+
+@app.on_event("startup")
+async def startup_enrichment_queue():
+    enrichment_queue.start()
+
+
+@app.on_event("startup")
+async def startup_broadcaster():
+    await broadcaster.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_camera_buffer():
+    # Open bursts go to the buffer first, then everything is written out
+    await camera_dedup.stop()
+    await camera_buffer.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_broadcaster():
+    await broadcaster.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_enrichment_queue():
+    await enrichment_queue.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_http_session():
+    await close_http_session()
+
+
 # get_camera(* , security_key: str = Header(None)):
 # Validate the security key
 # if security_key != key:
@@ -49,52 +145,115 @@ app.add_middleware(
 # /camera
 
 
-@app.get("/camera", response_model=list[CameraModel], tags=['camera'])
-async def get_camera():
-    return await Camera.find().to_list(length=None)
+@app.get("/camera", response_model=list[partial_model(CameraModel)], response_model_exclude_unset=True, tags=['camera'])
+async def get_camera(response: Response, params: ListParams = Depends(), window: CameraWindow = Depends()):
+    return await list_documents(Camera, response, params, window.query(), model=CameraModel, sort_key='time')
+
+
+@app.get("/camera/last/{license_plate_number}", response_model=CameraModel, tags=['camera'])
+async def get_camera_last_seen(license_plate_number: str):
+    # A plate still in front of a camera here isn't stored until its burst ends
+    event = camera_dedup.open_burst(license_plate_number) or await last_seen(license_plate_number)
+    if event is None:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                            detail=f"Plate {license_plate_number} not seen")
+    return event
 
 
 @app.post("/camera", response_model=CameraModel, status_code=HTTPStatus.CREATED, tags=['camera'])
-async def add_camera(item: CameraModel):
-    item = jsonable_encoder(item)
-    new = await Camera.insert_one(item)
-    return await Camera.find_one({"_id": new.inserted_id})
+async def add_camera(item: CameraModel, response: Response,
+                     prefer: ReturnPreference = Depends(return_preference)):
+    # Written behind, together with other events, by the camera buffer
+    item = camera_document(item)
+    arrivals = enqueue_camera_events([item])
+    if not arrivals:
+        # A repeat read only extends the plate's open burst, which is the event that gets stored
+        response.status_code = HTTPStatus.OK
+        burst = dict(camera_dedup.open_burst(item['license_plate_number']))
+        if prefer == ReturnPreference.minimal:
+            return JSONResponse(content={"_id": burst['_id']})
+        return burst
+
+    arrival_cache.prefetch([arrival['license_plate_number'] for arrival in arrivals])
+    broadcaster.publish('camera.arrival', arrivals)
+    return created_response(item, prefer)
+
+
+@app.post("/camera/batch", status_code=HTTPStatus.ACCEPTED, tags=['camera'],
+          openapi_extra=bulk_request_body(CameraModel))
+async def add_camera_batch(rows: list = Depends(read_bulk_rows)):
+    documents, errors = camera_documents(rows)
+    arrivals = enqueue_camera_events(documents)
+    arrival_cache.prefetch([arrival['license_plate_number'] for arrival in arrivals])
+    broadcaster.publish('camera.arrival', arrivals)
+    return {"accepted": len(documents), "arrivals": len(arrivals), "errors": errors, "queued": camera_buffer.depth}
 
 
 @app.delete("/camera/{customer_id}", tags=['camera'])
 async def delete_camera(customer_id: str):
-    result = await Camera.delete_one({"_id": customer_id})
+    try:
+        result = await Camera.delete_one({"_id": customer_id})
+    except OperationFailure:
+        # Time-series collections only accept arbitrary deletes from MongoDB 7.0
+        raise HTTPException(status_code=HTTPStatus.CONFLICT,
+                            detail="Camera events can't be deleted one by one on this server, they expire instead")
 
     if result.deleted_count == 0:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such customer")
 
 
+# /arrivals
+
+@app.get("/arrivals/{license_plate_number}", tags=['arrivals'])
+async def show_arrival(license_plate_number: str):
+    # Car, customers, open and finished repairs in one response, usually
+    # prefetched when a camera saw the plate
+    return await arrival_cache.bundle(license_plate_number)
+
+
+# /events
+
+@app.get("/events", tags=['events'])
+async def get_events(topics: list[EventTopic] | None = Query(default=None, alias='topic'),
+                     last_event_id: str | None = Header(default=None),
+                     resume: str | None = Query(default=None, description="Last event id seen, "
+                                                "for clients that can't send Last-Event-ID")):
+    # Server-sent events: camera arrivals and repair changes as they happen,
+    # instead of polling /camera and /repairs
+    return event_stream(topics or list(EventTopic), last_event_id or resume)
+
+
 # /customers
 
-@app.get("/customers", response_model=list[CustomerModel], tags=['customers'])
-async def get_customers():
-    return await CUSTOMERS.find().to_list(length=None)
+@app.get("/customers", response_model=list[partial_model(CustomerModel)], response_model_exclude_unset=True,
+         tags=['customers'])
+async def get_customers(response: Response, params: ListParams = Depends()):
+    return await list_documents(CUSTOMERS, response, params, model=CustomerModel)
 
 
 @app.post("/customers", response_model=CustomerModel, status_code=HTTPStatus.CREATED, tags=['customers'])
-async def add_customer(customer: CustomerModel):
+async def add_customer(customer: CustomerModel, prefer: ReturnPreference = Depends(return_preference)):
     await assert_cars_dont_belong_to_another_customer(customer.cars)
 
     customer = jsonable_encoder(customer)
-    new_customer = await CUSTOMERS.insert_one(customer)
-    return await CUSTOMERS.find_one({"_id": new_customer.inserted_id})
+    response = await insert_document(CUSTOMERS, customer, prefer)
+    customers_index.upsert(customer)
+    arrival_cache.forget(*customer['cars'])
+    return response
 
 
-@app.get("/customers/{customer_id}", response_model=CustomerModel, tags=['customers'])
-async def show_customer(customer_id: str):
-    customer = await CUSTOMERS.find_one({"_id": customer_id})
+@app.get("/customers/{customer_id}", response_model=partial_model(CustomerModel), response_model_exclude_unset=True,
+         tags=['customers'])
+async def show_customer(customer_id: str, response: Response,
+                        fields: list[str] | None = Depends(requested_fields)):
+    customer = await CUSTOMERS.find_one({"_id": customer_id}, projection=fields_projection(CustomerModel, fields))
 
     if customer is None:
         raise HTTPException(
             status_code=404, detail=f"Customer {customer_id} not found")
 
-    return customer
+    return document_response(CustomerModel, customer, fields, response)
 
 
 @app.get("/customersbycar/{plate_num}", tags=['customers'])
@@ -111,27 +270,34 @@ async def show_customer(plate_num: str):
 async def update_customer(customer_id: str, customer: UpdateCustomerModel = Body(...)):
     new_customer = customer.dict()
 
-    existing = await CUSTOMERS.find_one({"_id": customer_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"Customer {customer_id} not found")
-
     if 'cars' in new_customer:
-        await assert_cars_dont_belong_to_another_customer(new_customer['cars'], existing['_id'])
-
-    await CUSTOMERS.update_one({"_id": customer_id}, {"$set": new_customer})
-
-    return await CUSTOMERS.find_one({"_id": customer_id})
+        try:
+            await assert_cars_dont_belong_to_another_customer(new_customer['cars'], customer_id)
+        except HTTPException:
+            # A missing customer is reported as such before any conflict
+            if await CUSTOMERS.count_documents({"_id": customer_id}, limit=1) == 0:
+                raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                                    detail=f"Customer {customer_id} not found")
+            raise
+
+    updated = await update_document(CUSTOMERS, {"_id": customer_id}, new_customer,
+                                    f"Customer {customer_id} not found")
+    customers_index.upsert(updated)
+    arrival_cache.forget(*updated.get('cars') or [])
+    return updated
 
 
 @app.delete("/customers/{customer_id}", tags=['customers'])
 async def delete_customer(customer_id: str):
-    result = await CUSTOMERS.delete_one({"_id": customer_id})
+    customer = await CUSTOMERS.find_one_and_delete({"_id": customer_id}, projection={"cars": 1})
 
-    if result.deleted_count == 0:
+    if customer is None:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such customer")
 
+    customers_index.remove(customer_id)
+    arrival_cache.forget(*customer.get('cars') or [])
+
 
 @app.get("/customers/{customer_id}/cars/", response_model=list[str], tags=['customers'])
 async def get_cars_for_customer(customer_id: str):
@@ -149,6 +315,7 @@ async def add_car_to_customer(customer_id: str, plate_number_to_add: str):
         raise HTTPException(status_code=HTTPStatus.CONFLICT,
                             detail='Car already exists')
 
+    arrival_cache.forget(plate_number_to_add)
     return await get_cars_by_id(customer_id)
 
 
@@ -163,6 +330,7 @@ async def remove_car_for_customer(customer_id: str, plate_number_to_delete: str)
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='No such car')
 
+    arrival_cache.forget(plate_number_to_delete)
     return await get_cars_by_id(customer_id)
 
 
@@ -188,9 +356,9 @@ async def get_cars_by_id(customer_id) -> list[str]:
 
 # /cars
 
-@app.get("/cars", response_model=list[CarModel], tags=['cars'])
-async def get_cars():
-    return await CARS.find().to_list(length=None)
+@app.get("/cars", response_model=list[partial_model(CarModel)], response_model_exclude_unset=True, tags=['cars'])
+async def get_cars(response: Response, params: ListParams = Depends()):
+    return await list_documents(CARS, response, params, model=CarModel)
 
 
 @app.get("/cars/types/{car_num}", tags=['cars'])
@@ -208,113 +376,40 @@ async def get_car_type(car_num: str):
 
 @app.get("/cars/types", tags=['cars'])
 async def get_car_types():
-    cars = await CARS.find().to_list(length=None)
-    list = []
-    for car in cars:
-        if car["government_data"] is not None:
-            x = car["government_data"]["tozar"]
-            y = car["government_data"]["kinuy_mishari"]
-            # z = car["government_data"]["shnat_yitzur"]
-            dic = {'tozar': x, 'kinuy_mishari': y}
-            list.append(dic)
-    # return list
-    new_list = []
-    for one_student_choice in list:
-        if one_student_choice not in new_list:
-            new_list.append(one_student_choice)
-    return new_list
-
-
-# async def get_car_types():
-#     return await CARS.distinct(f'government_data.{"tozar"}')
+    return await car_types.get()
 
 
 @app.post("/cars", response_model=CarModel, status_code=HTTPStatus.CREATED, tags=['cars'])
-async def add_car(car: CarModel, bg_tasks: BackgroundTasks):
+async def add_car(car: CarModel, prefer: ReturnPreference = Depends(return_preference)):
     car = jsonable_encoder(car)
 
     existing_car = await CARS.find_one(
         {"license_plate_number": car["license_plate_number"]}
     )
-    if existing_car:
-        # If the license plate number already exists, continue with the existing _id
-        _id = existing_car["_id"]
-    else:
+    if existing_car is None:
         # If the license plate number does not exist, insert a new car
-        new = await CARS.insert_one(car)
-        _id = new.inserted_id
-    new_car = await CARS.find_one(
-        {"_id": _id},
-        projection={"license_plate_number": 1}
-    )
-    bg_tasks.add_task(enrich_car, _id,
-                      new_car['license_plate_number'])
+        try:
+            await CARS.insert_one(car)
+        except DuplicateKeyError:
+            # Another request inserted the same plate in the meantime
+            existing_car = await CARS.find_one(
+                {"license_plate_number": car["license_plate_number"]}
+            )
 
-    new_car_result = await CARS.find_one(
-        {"_id": _id}
-    )
-    return new_car_result
-
-
-async def enrich_car(car_oid: str, license_plate_number: str):
-    result = await get_car_info_from_gov_db(license_plate_number)
-    await CARS.update_one({"_id": car_oid}, {"$set": {"government_data": result}})
-
-
-async def get_car_info_from_gov_db(license_plate_number: str):
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as session:
-        async with session.post(
-                url='https://data.gov.il/api/3/action/datastore_search',
-                json={
-                    "resource_id": "053cea08-09bc-40ec-8f7a-156f0677aff3",
-                    "filters": {
-                        "mispar_rechev": [license_plate_number]
-                    },
-                    "limit": 2,
-                    "offset": 0
-                }
-        ) as response:
-            records = (await response.json())['result']['records']
-# if not found look here -  "mispar_rechev": [license_plate_number]
-# 03adc637-b6fe-402b-9937-7c3d3afc9140
-# ואם לא אז צריך לחפש פה
-# resource_id=cd3acc5c-03c3-4c89-9c54-d40f93c0d790
-# ואם לא אז לבדוק אם הרכב ירד מהכביש פה
-# resource_id=851ecab1-0622-4dbe-a6c7-f950cf82abf9
-# ואם הוא ירד מהכביש תעדכן את פפוש איזה סעיף צריך לבדוק
-
-            try:
-                result = records[0]
-                async with session.post(
-                        url='https://data.gov.il/api/3/action/datastore_search',
-                        json={
-                            "resource_id": "5e87a7a1-2f6f-41c1-8aec-7216d52a6cf6",
-                            "filters": {
-                                "tozeret_cd": [
-                                    str(result['tozeret_cd']).zfill(4)
-                                ],
-                                "degem_cd": [
-                                    str(result['degem_cd']).zfill(4)
-                                ],
-                                "shnat_yitzur": [
-                                    str(result['shnat_yitzur'])
-                                ]
-                            },
-                            "limit": 2,
-                            "offset": 0
-                        }
-                ) as r:
-                    final = (await r.json())['result']['records']
-                    final[0].update(result)
-                    return final[0]
-            except IndexError:
-                print(f"Car not found in gov db {license_plate_number}")
-                return None
+    # If the license plate number already exists, continue with the existing car
+    if existing_car is not None:
+        car = existing_car
+
+    enrichment_queue.submit(car["_id"], car["license_plate_number"])
+    arrival_cache.forget(car["license_plate_number"])
+    return created_response(car, prefer)
 
 
 @app.get("/cars/{license_plate_number}", tags=['cars'])
-async def show_car(license_plate_number: str):
-    car = await CARS.find_one({"license_plate_number": license_plate_number})
+async def show_car(license_plate_number: str,
+                   fields: list[str] | None = Depends(requested_fields)):
+    car = await CARS.find_one({"license_plate_number": license_plate_number},
+                              projection=fields_projection(CarModel, fields))
 
     if car is None:
         return {"detail": f"Car {license_plate_number} not found"}
@@ -326,17 +421,14 @@ async def show_car(license_plate_number: str):
 async def update_car(license_plate_number: str, bg_tasks: BackgroundTasks, car: UpdateCarModel = Body(...)):
     new_car = car.dict()
 
-    existing = await CARS.find_one(
-        {"license_plate_number": license_plate_number},
-        projection={"_id": 0, "license_plate_number": 1}
-    )
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"Car {license_plate_number} not found")
-
-    await CARS.update_one({"license_plate_number": license_plate_number}, {"$set": new_car})
-
-    return await CARS.find_one({"license_plate_number": license_plate_number})
+    try:
+        updated = await update_document(CARS, {"license_plate_number": license_plate_number}, new_car,
+                                        f"Car {license_plate_number} not found")
+    except DuplicateKeyError:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT,
+                            detail=f"Car {new_car['license_plate_number']} already exists")
+    arrival_cache.forget(license_plate_number, updated['license_plate_number'])
+    return updated
 
 
 @app.delete("/cars/{license_plate_number}", tags=['cars'])
@@ -351,42 +443,78 @@ async def delete_car(license_plate_number: str):
         raise HTTPException(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="Deleted more than one car!")
 
+    arrival_cache.forget(license_plate_number)
+
 
 # /storage
 
-@app.get("/storage", response_model=list[ItemModel], tags=['storage'])
-async def get_storage():
-    return await Storage.find().to_list(length=None)
+@app.get("/storage", response_model=list[partial_model(ItemModel)], response_model_exclude_unset=True, tags=['storage'])
+async def get_storage(response: Response, params: ListParams = Depends()):
+    return await list_documents(Storage, response, params, model=ItemModel)
 
 
 @app.post("/storage", response_model=ItemModel, status_code=HTTPStatus.CREATED, tags=['storage'])
-async def add_storage(item: ItemModel):
+async def add_storage(item: ItemModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await Storage.insert_one(item)
-    return await Storage.find_one({"_id": new.inserted_id})
-
-
-@app.get("/storage/{item_id}", response_model=ItemModel, tags=['storage'])
-async def show_storage(item_id: str):
-    item = await Storage.find_one({"_id": item_id})
+    response = await insert_document(Storage, item, prefer)
+    storage_index.upsert(item)
+    return response
+
+
+@app.post("/storage/bulk", tags=['storage'], openapi_extra=bulk_request_body(ItemModel))
+async def add_storage_bulk(rows: list = Depends(read_bulk_rows)):
+    documents, errors = validate_rows(ItemModel, rows)
+    results = await bulk_upsert(Storage, documents, upsert_on_barcode=True)
+    storage_index.reload_soon()
+    return summarize(errors + results)
+
+
+@app.post("/storage/import", status_code=HTTPStatus.ACCEPTED, tags=['storage'],
+          openapi_extra=import_request_body())
+async def import_storage(request: Request,
+                         import_format: ImportFormat | None = Query(default=None, alias='format'),
+                         encoding: str = Query(default='utf-8-sig'),
+                         mapping: str | None = Query(default=None),
+                         supplier: str | None = Query(default=None),
+                         filename: str | None = Query(default=None)):
+    import_format = detect_format(request, import_format)
+    mapping = parse_mapping(mapping, ItemModel)
+    check_encoding(encoding)
+    defaults = {"supplier": supplier} if supplier else {}
+
+    upload = await spool_upload(request)
+    job = await create_job('storage', filename)
+    start_import(job, upload, import_format, encoding, mapping, defaults, ItemModel, Storage,
+                 upsert_on_barcode=True, on_done=storage_index.reload_soon)
+    return job
+
+
+@app.get("/storage/{item_id}", response_model=partial_model(ItemModel), response_model_exclude_unset=True,
+         tags=['storage'])
+async def show_storage(item_id: str, response: Response,
+                       fields: list[str] | None = Depends(requested_fields)):
+    item = await Storage.find_one({"_id": item_id}, projection=fields_projection(ItemModel, fields))
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"storage {item_id} not found")
-    return item
+    return document_response(ItemModel, item, fields, response)
 
 
-@app.get("/storagebarcode/{item_id}", response_model=ItemModel, tags=['storage'])
-async def show_storage(item_id: str):
-    item = await Storage.find_one({"barcode": item_id})
+@app.get("/storagebarcode/{item_id}", response_model=partial_model(ItemModel), response_model_exclude_unset=True,
+         tags=['storage'])
+async def show_storage(item_id: str, response: Response,
+                       fields: list[str] | None = Depends(requested_fields)):
+    item = await Storage.find_one({"barcode": item_id}, projection=fields_projection(ItemModel, fields))
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"storage {item_id} not found")
-    return item
+    return document_response(ItemModel, item, fields, response)
 
 
-@app.get("/storagebycategory/{category_id}", response_model=list[ItemModel], tags=['storage'])
-async def show_storage(category_id: str):
-    item = await Storage.find({"category": category_id}).to_list(length=None)
+@app.get("/storagebycategory/{category_id}", response_model=list[partial_model(ItemModel)], response_model_exclude_unset=True,
+         tags=['storage'])
+async def show_storage(category_id: str, response: Response, params: ListParams = Depends()):
+    item = await list_documents(Storage, response, params, {"category": category_id}, model=ItemModel)
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"storage {category_id} not found")
@@ -397,14 +525,26 @@ async def show_storage(category_id: str):
 async def update_storage(item_id: str, item: UpdateItemModel = Body(...)):
     new_item = item.dict()
 
-    existing = await Storage.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"storage {item_id} not found")
+    updated = await update_document(Storage, {"_id": item_id}, new_item,
+                                    f"storage {item_id} not found")
+    storage_index.upsert(updated)
+    return updated
+
 
-    await Storage.update_one({"_id": item_id}, {"$set": new_item})
+@app.post("/storage/movements", tags=['storage'])
+async def add_storage_movements(movements: list[StockMovementModel] = Body(...)):
+    return await apply_movements(Storage, StockMovements, movements)
 
-    return await Storage.find_one({"_id": item_id})
+
+@app.post("/storage/{item_id}/movements", response_model=StockMovementModel, status_code=HTTPStatus.CREATED,
+          tags=['storage'])
+async def add_storage_movement(item_id: str, movement: StockMovementModel = Body(...)):
+    return await apply_movement(Storage, StockMovements, item_id, movement)
+
+
+@app.get("/storage/{item_id}/movements", response_model=list[StockMovementModel], tags=['storage'])
+async def get_storage_movements(item_id: str, response: Response, params: ListParams = Depends()):
+    return await list_documents(StockMovements, response, params, {"item_id": item_id})
 
 
 @app.delete("/storage/{item_id}", tags=['storage'])
@@ -415,44 +555,46 @@ async def delete_storage(item_id: str):
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such item")
 
+    storage_index.remove(item_id)
+
 # /usedItems
 
 
-@app.get("/used", response_model=list[UsedModel], tags=['used'])
-async def get_used():
-    return await Used.find().to_list(length=None)
+@app.get("/used", response_model=list[partial_model(UsedModel)], response_model_exclude_unset=True, tags=['used'])
+async def get_used(response: Response, params: ListParams = Depends()):
+    return await list_documents(Used, response, params, model=UsedModel)
 
 
 @app.post("/used", response_model=UsedModel, status_code=HTTPStatus.CREATED, tags=['used'])
-async def add_used(item: UsedModel):
+async def add_used(item: UsedModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await Used.insert_one(item)
-    return await Used.find_one({"_id": new.inserted_id})
+    return await insert_document(Used, item, prefer)
 
 
-@app.get("/used/{item_id}", response_model=UsedModel, tags=['used'])
-async def show_used(item_id: str):
-    item = await Used.find_one({"_id": item_id})
+@app.post("/used/bulk", tags=['used'], openapi_extra=bulk_request_body(UsedModel))
+async def add_used_bulk(rows: list = Depends(read_bulk_rows)):
+    documents, errors = validate_rows(UsedModel, rows)
+    return summarize(errors + await bulk_upsert(Used, documents))
+
+
+@app.get("/used/{item_id}", response_model=partial_model(UsedModel), response_model_exclude_unset=True, tags=['used'])
+async def show_used(item_id: str, response: Response,
+                    fields: list[str] | None = Depends(requested_fields)):
+    item = await Used.find_one({"_id": item_id}, projection=fields_projection(UsedModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"used {item_id} not found")
 
-    return item
+    return document_response(UsedModel, item, fields, response)
 
 
 @app.put("/used/{item_id}", response_model=UsedModel, tags=['used'])
 async def update_used(item_id: str, item: UpdateUsedModel = Body(...)):
     new_item = item.dict()
 
-    existing = await Used.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"used {item_id} not found")
-
-    await Used.update_one({"_id": item_id}, {"$set": new_item})
-
-    return await Used.find_one({"_id": item_id})
+    return await update_document(Used, {"_id": item_id}, new_item,
+                                 f"used {item_id} not found")
 
 
 @app.delete("/used/{item_id}", tags=['used'])
@@ -466,41 +608,42 @@ async def delete_used(item_id: str):
 
 # /ToolsItems
 
-@app.get("/tools", response_model=list[ToolsModel], tags=['tools'])
-async def get_tools():
-    return await Tools.find().to_list(length=None)
+@app.get("/tools", response_model=list[partial_model(ToolsModel)], response_model_exclude_unset=True, tags=['tools'])
+async def get_tools(response: Response, params: ListParams = Depends()):
+    return await list_documents(Tools, response, params, model=ToolsModel)
 
 
 @app.post("/tools", response_model=ToolsModel, status_code=HTTPStatus.CREATED, tags=['tools'])
-async def add_tools(item: ToolsModel):
+async def add_tools(item: ToolsModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await Tools.insert_one(item)
-    return await Tools.find_one({"_id": new.inserted_id})
+    return await insert_document(Tools, item, prefer)
+
 
+@app.post("/tools/bulk", tags=['tools'], openapi_extra=bulk_request_body(ToolsModel))
+async def add_tools_bulk(rows: list = Depends(read_bulk_rows)):
+    documents, errors = validate_rows(ToolsModel, rows)
+    return summarize(errors + await bulk_upsert(Tools, documents))
 
-@app.get("/tools/{item_id}", response_model=ToolsModel, tags=['tools'])
-async def show_tools(item_id: str):
-    item = await Tools.find_one({"_id": item_id})
+
+@app.get("/tools/{item_id}", response_model=partial_model(ToolsModel), response_model_exclude_unset=True,
+         tags=['tools'])
+async def show_tools(item_id: str, response: Response,
+                     fields: list[str] | None = Depends(requested_fields)):
+    item = await Tools.find_one({"_id": item_id}, projection=fields_projection(ToolsModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"tools {item_id} not found")
 
-    return item
+    return document_response(ToolsModel, item, fields, response)
 
 
 @app.put("/tools/{item_id}", response_model=ToolsModel, tags=['tools'])
 async def update_tools(item_id: str, item: UpdateToolsModel = Body(...)):
     new_item = item.dict()
 
-    existing = await Tools.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"tools {item_id} not found")
-
-    await Tools.update_one({"_id": item_id}, {"$set": new_item})
-
-    return await Tools.find_one({"_id": item_id})
+    return await update_document(Tools, {"_id": item_id}, new_item,
+                                 f"tools {item_id} not found")
 
 
 @app.delete("/tools/{item_id}", tags=['tools'])
@@ -514,41 +657,41 @@ async def delete_tools(item_id: str):
 
 # /tipulim
 
-@app.get("/tipul", response_model=list[TipulModel], tags=['tipul'])
-async def get_tipul():
-    return await Tipul.find().to_list(length=None)
+@app.get("/tipul", response_model=list[partial_model(TipulModel)], response_model_exclude_unset=True,
+         tags=['tipul'], dependencies=[conditional_get(Tipul.name)])
+async def get_tipul(response: Response, params: ListParams = Depends()):
+    return await list_documents(Tipul, response, params, model=TipulModel)
 
 
 @app.post("/tipul", response_model=TipulModel, status_code=HTTPStatus.CREATED, tags=['tipul'])
-async def add_tipul(item: TipulModel):
+async def add_tipul(item: TipulModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await Tipul.insert_one(item)
-    return await Tipul.find_one({"_id": new.inserted_id})
+    response = await insert_document(Tipul, item, prefer)
+    await versions.bump(Tipul.name)
+    return response
 
 
-@app.get("/tipul/{item_id}", response_model=TipulModel, tags=['tipul'])
-async def show_tipul(item_id: str):
-    item = await Tipul.find_one({"_id": item_id})
+@app.get("/tipul/{item_id}", response_model=partial_model(TipulModel), response_model_exclude_unset=True,
+         tags=['tipul'], dependencies=[conditional_get(Tipul.name)])
+async def show_tipul(item_id: str, response: Response,
+                     fields: list[str] | None = Depends(requested_fields)):
+    item = await reference_cache.find_one(Tipul, item_id, fields_projection(TipulModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"tipul {item_id} not found")
 
-    return item
+    return document_response(TipulModel, item, fields, response)
 
 
 @app.put("/tipul/{item_id}", response_model=TipulModel, tags=['tipul'])
 async def update_tipul(item_id: str, item: UpdateTipulModel = Body(...)):
     new_item = item.dict()
 
-    existing = await Tipul.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"tipul {item_id} not found")
-
-    await Tipul.update_one({"_id": item_id}, {"$set": new_item})
-
-    return await Tipul.find_one({"_id": item_id})
+    updated = await update_document(Tipul, {"_id": item_id}, new_item,
+                                    f"tipul {item_id} not found")
+    await versions.bump(Tipul.name)
+    return updated
 
 
 @app.delete("/tipul/{item_id}", tags=['tipul'])
@@ -559,44 +702,46 @@ async def delete_tipul(item_id: str):
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such item")
 
+    await versions.bump(Tipul.name)
+
 
 # /tipulimgroup
 
-@app.get("/tipulgroup", response_model=list[TipulGroupModel], tags=['tipulgroup'])
-async def get_tipul_group():
-    return await TipulGroup.find().to_list(length=None)
+@app.get("/tipulgroup", response_model=list[partial_model(TipulGroupModel)], response_model_exclude_unset=True,
+         tags=['tipulgroup'], dependencies=[conditional_get(TipulGroup.name)])
+async def get_tipul_group(response: Response, params: ListParams = Depends()):
+    return await list_documents(TipulGroup, response, params, model=TipulGroupModel)
 
 
 @app.post("/tipulgroup", response_model=TipulGroupModel, status_code=HTTPStatus.CREATED, tags=['tipulgroup'])
-async def add_tipul_group(item: TipulGroupModel):
+async def add_tipul_group(item: TipulGroupModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await TipulGroup.insert_one(item)
-    return await TipulGroup.find_one({"_id": new.inserted_id})
+    response = await insert_document(TipulGroup, item, prefer)
+    await versions.bump(TipulGroup.name)
+    return response
 
 
-@app.get("/tipulgroup/{item_id}", response_model=TipulGroupModel, tags=['tipulgroup'])
-async def show_tipul_group(item_id: str):
-    item = await TipulGroup.find_one({"_id": item_id})
+@app.get("/tipulgroup/{item_id}", response_model=partial_model(TipulGroupModel), response_model_exclude_unset=True,
+         tags=['tipulgroup'], dependencies=[conditional_get(TipulGroup.name)])
+async def show_tipul_group(item_id: str, response: Response,
+                           fields: list[str] | None = Depends(requested_fields)):
+    item = await reference_cache.find_one(TipulGroup, item_id, fields_projection(TipulGroupModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"tipul group {item_id} not found")
 
-    return item
+    return document_response(TipulGroupModel, item, fields, response)
 
 
 @app.put("/tipulgroup/{item_id}", response_model=TipulGroupModel, tags=['tipulgroup'])
 async def update_tipul_group(item_id: str, item: UpdateTipulGroupModel = Body(...)):
     new_item = item.dict()
 
-    existing = await TipulGroup.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"tipul group {item_id} not found")
-
-    await TipulGroup.update_one({"_id": item_id}, {"$set": new_item})
-
-    return await TipulGroup.find_one({"_id": item_id})
+    updated = await update_document(TipulGroup, {"_id": item_id}, new_item,
+                                    f"tipul group {item_id} not found")
+    await versions.bump(TipulGroup.name)
+    return updated
 
 
 @app.delete("/tipulgroup/{item_id}", tags=['tipulgroup'])
@@ -607,74 +752,93 @@ async def delete_tipul(item_id: str):
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such item")
 
+    await versions.bump(TipulGroup.name)
+
 
 # /repairs
 
 
-@app.get("/repairs", response_model=list[RepairModel], tags=['repairs'])
-async def get_repairs():
-    return await Repairs.find().to_list(length=None)
+@app.get("/repairs", response_model=list[partial_model(RepairModel)], response_model_exclude_unset=True,
+         tags=['repairs'])
+async def get_repairs(response: Response, params: ListParams = Depends()):
+    return await list_documents(Repairs, response, params, model=RepairModel)
 
 
 @app.post("/repairs", response_model=RepairModel, status_code=HTTPStatus.CREATED, tags=['repairs'])
-async def add_repairs(item: RepairModel):
+async def add_repairs(item: RepairModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await Repairs.insert_one(item)
-    return await Repairs.find_one({"_id": new.inserted_id})
+    arrival_cache.forget(item['license_plate_number'])
+    response = await insert_document(Repairs, item, prefer)
+    broadcaster.publish('repairs.created', [item])
+    return response
 
 
-@app.get("/repairs/{item_id}", response_model=RepairModel, tags=['repairs'])
-async def show_repairs(item_id: str):
-    item = await Repairs.find_one({"_id": item_id})
+@app.get("/repairs/{item_id}", response_model=partial_model(RepairModel), response_model_exclude_unset=True,
+         tags=['repairs'])
+async def show_repairs(item_id: str, response: Response,
+                       fields: list[str] | None = Depends(requested_fields)):
+    item = await Repairs.find_one({"_id": item_id}, projection=fields_projection(RepairModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"repairs {item_id} not found")
 
-    return item
+    return document_response(RepairModel, item, fields, response)
 
 
 @app.put("/repairs/{item_id}", response_model=RepairModel, tags=['repairs'])
 async def update_repairs(item_id: str, item: UpdateRepairModel = Body(...)):
     new_item = item.dict()
 
-    existing = await Repairs.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"repairs {item_id} not found")
+    updated = await update_document(Repairs, {"_id": item_id}, new_item,
+                                    f"repairs {item_id} not found")
+    arrival_cache.forget(updated['license_plate_number'])
+    broadcaster.publish('repairs.updated', [updated])
+    return updated
 
-    await Repairs.update_one({"_id": item_id}, {"$set": new_item})
 
-    return await Repairs.find_one({"_id": item_id})
+@app.post("/repairs/{item_id}/finish", response_model=RepairFinishModel, status_code=HTTPStatus.CREATED,
+          tags=['repairs'])
+async def finish_repairs(item_id: str, finish: FinishRepairModel = Body(default=FinishRepairModel())):
+    finished = await finish_repair(item_id, finish)
+    arrival_cache.forget(finished['license_plate_number'])
+    broadcaster.publish('repairs.finished', [finished])
+    return finished
 
 
 @app.delete("/repairs/{item_id}", tags=['repairs'])
 async def delete_repairs(item_id: str):
-    result = await Repairs.delete_one({"_id": item_id})
+    repair = await Repairs.find_one_and_delete({"_id": item_id}, projection={"license_plate_number": 1})
 
-    if result.deleted_count == 0:
+    if repair is None:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such item")
 
+    arrival_cache.forget(repair['license_plate_number'])
+    broadcaster.publish('repairs.deleted', [repair])
+
 
 # /repairsfinish
 
 
-@app.get("/repairsfinish", response_model=list[RepairFinishModel], tags=['repairsfinish'])
-async def get_repairsfinish():
-    return await RepairsFinish.find().to_list(length=None)
+@app.get("/repairsfinish", response_model=list[partial_model(RepairFinishModel)], response_model_exclude_unset=True,
+         tags=['repairsfinish'])
+async def get_repairsfinish(response: Response, params: ListParams = Depends()):
+    return await list_documents(RepairsFinish, response, params, model=RepairFinishModel)
 
 
 @app.post("/repairsfinish", response_model=RepairFinishModel, status_code=HTTPStatus.CREATED, tags=['repairsfinish'])
-async def add_repairsfinish(item: RepairFinishModel):
+async def add_repairsfinish(item: RepairFinishModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await RepairsFinish.insert_one(item)
-    return await RepairsFinish.find_one({"_id": new.inserted_id})
+    arrival_cache.forget(item['license_plate_number'])
+    return await insert_document(RepairsFinish, item, prefer)
 
 
-@app.get("/repairsfinish/{item_id}", response_model=list[RepairFinishModel], tags=['repairsfinish'])
-async def show_repairsfinish(item_id: str):
-    item = await RepairsFinish.find({"license_plate_number": item_id}).to_list(length=None)
+@app.get("/repairsfinish/{item_id}", response_model=list[partial_model(RepairFinishModel)], response_model_exclude_unset=True,
+         tags=['repairsfinish'])
+async def show_repairsfinish(item_id: str, response: Response, params: ListParams = Depends()):
+    item = await list_documents(RepairsFinish, response, params, {"license_plate_number": item_id},
+                                model=RepairFinishModel)
 
     if item is None:
         raise HTTPException(
@@ -685,52 +849,54 @@ async def show_repairsfinish(item_id: str):
 
 @app.delete("/repairsfinish/{item_id}", tags=['repairsfinish'])
 async def delete_repairsfinish(item_id: str):
-    result = await RepairsFinish.delete_one({"_id": item_id})
+    repair = await RepairsFinish.find_one_and_delete({"_id": item_id}, projection={"license_plate_number": 1})
 
-    if result.deleted_count == 0:
+    if repair is None:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such item")
 
+    arrival_cache.forget(repair['license_plate_number'])
+
 
 # /category
 
 
-@app.get("/category", response_model=list[StorageCategoryModel], tags=['category'])
-async def get_category():
-    return await Category.find().to_list(length=None)
+@app.get("/category", response_model=list[partial_model(StorageCategoryModel)], response_model_exclude_unset=True,
+         tags=['category'], dependencies=[conditional_get(Category.name)])
+async def get_category(response: Response, params: ListParams = Depends()):
+    return await list_documents(Category, response, params, model=StorageCategoryModel)
 
 
 @app.post("/category", response_model=StorageCategoryModel, status_code=HTTPStatus.CREATED, tags=['category'])
-async def add_category(item: StorageCategoryModel):
+async def add_category(item: StorageCategoryModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
     item['number'] = await Category.count_documents({})
-    new = await Category.insert_one(item)
-    return await Category.find_one({"_id": new.inserted_id})
+    response = await insert_document(Category, item, prefer)
+    await versions.bump(Category.name)
+    return response
 
 
-@app.get("/category/{item_id}", response_model=StorageCategoryModel, tags=['category'])
-async def show_category(item_id: str):
-    item = await Category.find_one({"_id": item_id})
+@app.get("/category/{item_id}", response_model=partial_model(StorageCategoryModel), response_model_exclude_unset=True,
+         tags=['category'], dependencies=[conditional_get(Category.name)])
+async def show_category(item_id: str, response: Response,
+                        fields: list[str] | None = Depends(requested_fields)):
+    item = await reference_cache.find_one(Category, item_id, fields_projection(StorageCategoryModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"category {item_id} not found")
 
-    return item
+    return document_response(StorageCategoryModel, item, fields, response)
 
 
 @app.put("/category/{item_id}", response_model=StorageCategoryModel, tags=['category'])
 async def update_category(item_id: str, item: UpdateStorageCategoryModel = Body(...)):
     new_item = item.dict()
 
-    existing = await Category.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"category {item_id} not found")
-
-    await Category.update_one({"_id": item_id}, {"$set": new_item})
-
-    return await Category.find_one({"_id": item_id})
+    updated = await update_document(Category, {"_id": item_id}, new_item,
+                                    f"category {item_id} not found")
+    await versions.bump(Category.name)
+    return updated
 
 
 @app.delete("/category/{item_id}", tags=['category'])
@@ -741,46 +907,48 @@ async def delete_category(item_id: str):
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such item")
 
+    await versions.bump(Category.name)
+
 
 # /categorytools
 
 
-@app.get("/categorytools", response_model=list[ToolsCategoryModel], tags=['categorytools'])
-async def get_categorytools():
-    return await CategoryTools.find().to_list(length=None)
+@app.get("/categorytools", response_model=list[partial_model(ToolsCategoryModel)], response_model_exclude_unset=True,
+         tags=['categorytools'], dependencies=[conditional_get(CategoryTools.name)])
+async def get_categorytools(response: Response, params: ListParams = Depends()):
+    return await list_documents(CategoryTools, response, params, model=ToolsCategoryModel)
 
 
 @app.post("/categorytools", response_model=ToolsCategoryModel, status_code=HTTPStatus.CREATED, tags=['categorytools'])
-async def add_categorytools(item: ToolsCategoryModel):
+async def add_categorytools(item: ToolsCategoryModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
     item['number'] = await Category.count_documents({})
-    new = await CategoryTools.insert_one(item)
-    return await CategoryTools.find_one({"_id": new.inserted_id})
+    response = await insert_document(CategoryTools, item, prefer)
+    await versions.bump(CategoryTools.name)
+    return response
 
 
-@app.get("/categorytools/{item_id}", response_model=ToolsCategoryModel, tags=['categorytools'])
-async def show_categorytools(item_id: str):
-    item = await CategoryTools.find_one({"_id": item_id})
+@app.get("/categorytools/{item_id}", response_model=partial_model(ToolsCategoryModel), response_model_exclude_unset=True,
+         tags=['categorytools'], dependencies=[conditional_get(CategoryTools.name)])
+async def show_categorytools(item_id: str, response: Response,
+                             fields: list[str] | None = Depends(requested_fields)):
+    item = await reference_cache.find_one(CategoryTools, item_id, fields_projection(ToolsCategoryModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"categorytools {item_id} not found")
 
-    return item
+    return document_response(ToolsCategoryModel, item, fields, response)
 
 
 @app.put("/categorytools/{item_id}", response_model=ToolsCategoryModel, tags=['categorytools'])
 async def update_categorytools(item_id: str, item: UpdateToolsCategoryModel = Body(...)):
     new_item = item.dict()
 
-    existing = await CategoryTools.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"categorytools {item_id} not found")
-
-    await CategoryTools.update_one({"_id": item_id}, {"$set": new_item})
-
-    return await CategoryTools.find_one({"_id": item_id})
+    updated = await update_document(CategoryTools, {"_id": item_id}, new_item,
+                                    f"categorytools {item_id} not found")
+    await versions.bump(CategoryTools.name)
+    return updated
 
 
 @app.delete("/categorytools/{item_id}", tags=['categorytools'])
@@ -791,45 +959,47 @@ async def delete_categorytools(item_id: str):
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such item")
 
+    await versions.bump(CategoryTools.name)
+
 
 # /area
 
 
-@app.get("/area", response_model=list[AreaModel], tags=['area'])
-async def get_area():
-    return await Area.find().to_list(length=None)
+@app.get("/area", response_model=list[partial_model(AreaModel)], response_model_exclude_unset=True,
+         tags=['area'], dependencies=[conditional_get(Area.name)])
+async def get_area(response: Response, params: ListParams = Depends()):
+    return await list_documents(Area, response, params, model=AreaModel)
 
 
 @app.post("/area", response_model=AreaModel, status_code=HTTPStatus.CREATED, tags=['area'])
-async def add_area(item: AreaModel):
+async def add_area(item: AreaModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await Area.insert_one(item)
-    return await Area.find_one({"_id": new.inserted_id})
+    response = await insert_document(Area, item, prefer)
+    await versions.bump(Area.name)
+    return response
 
 
-@app.get("/area/{item_id}", response_model=AreaModel, tags=['area'])
-async def show_area(item_id: str):
-    item = await Area.find_one({"_id": item_id})
+@app.get("/area/{item_id}", response_model=partial_model(AreaModel), response_model_exclude_unset=True,
+         tags=['area'], dependencies=[conditional_get(Area.name)])
+async def show_area(item_id: str, response: Response,
+                    fields: list[str] | None = Depends(requested_fields)):
+    item = await reference_cache.find_one(Area, item_id, fields_projection(AreaModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"area {item_id} not found")
 
-    return item
+    return document_response(AreaModel, item, fields, response)
 
 
 @app.put("/area/{item_id}", response_model=AreaModel, tags=['area'])
 async def update_area(item_id: str, item: UpdateAreaModel = Body(...)):
     new_item = item.dict()
 
-    existing = await Area.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"area {item_id} not found")
-
-    await Area.update_one({"_id": item_id}, {"$set": new_item})
-
-    return await Area.find_one({"_id": item_id})
+    updated = await update_document(Area, {"_id": item_id}, new_item,
+                                    f"area {item_id} not found")
+    await versions.bump(Area.name)
+    return updated
 
 
 @app.delete("/area/{item_id}", tags=['area'])
@@ -840,45 +1010,43 @@ async def delete_area(item_id: str):
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
                             detail="No such item")
 
+    await versions.bump(Area.name)
+
 
 # /supplier
 
 
-@app.get("/supplier", response_model=list[SupplierModel], tags=['supplier'])
-async def get_supplier():
-    return await SUPPLIER.find().to_list(length=None)
+@app.get("/supplier", response_model=list[partial_model(SupplierModel)], response_model_exclude_unset=True,
+         tags=['supplier'])
+async def get_supplier(response: Response, params: ListParams = Depends()):
+    return await list_documents(SUPPLIER, response, params, model=SupplierModel)
 
 
 @app.post("/supplier", response_model=SupplierModel, status_code=HTTPStatus.CREATED, tags=['supplier'])
-async def add_supplier(item: SupplierModel):
+async def add_supplier(item: SupplierModel, prefer: ReturnPreference = Depends(return_preference)):
     item = jsonable_encoder(item)
-    new = await SUPPLIER.insert_one(item)
-    return await SUPPLIER.find_one({"_id": new.inserted_id})
+    return await insert_document(SUPPLIER, item, prefer)
 
 
-@app.get("/supplier/{item_id}", response_model=SupplierModel, tags=['supplier'])
-async def show_supplier(item_id: str):
-    item = await SUPPLIER.find_one({"_id": item_id})
+@app.get("/supplier/{item_id}", response_model=partial_model(SupplierModel), response_model_exclude_unset=True,
+         tags=['supplier'])
+async def show_supplier(item_id: str, response: Response,
+                        fields: list[str] | None = Depends(requested_fields)):
+    item = await SUPPLIER.find_one({"_id": item_id}, projection=fields_projection(SupplierModel, fields))
 
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"supplier {item_id} not found")
 
-    return item
+    return document_response(SupplierModel, item, fields, response)
 
 
 @app.put("/supplier/{item_id}", response_model=SupplierModel, tags=['supplier'])
 async def update_supplier(item_id: str, item: UpdateSupplierModel = Body(...)):
     new_item = item.dict()
 
-    existing = await SUPPLIER.find_one({"_id": item_id}, projection={"_id": 1})
-    if existing is None:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND,
-                            detail=f"supplier {item_id} not found")
-
-    await SUPPLIER.update_one({"_id": item_id}, {"$set": new_item})
-
-    return await SUPPLIER.find_one({"_id": item_id})
+    return await update_document(SUPPLIER, {"_id": item_id}, new_item,
+                                 f"supplier {item_id} not found")
 
 
 @app.delete("/supplier/{item_id}", tags=['supplier'])
@@ -892,24 +1060,89 @@ async def delete_supplier(item_id: str):
 
 # /errors
 
-@app.get("/errorcode", response_model=list[ErrorCodeModel], tags=['errorcode'])
-async def get_errorcode():
-    return await ErrorCode.find().to_list(length=None)
+@app.get("/errorcode", response_model=list[partial_model(ErrorCodeModel)], response_model_exclude_unset=True,
+         tags=['errorcode'], dependencies=[conditional_get(ErrorCode.name)])
+async def get_errorcode(response: Response, params: ListParams = Depends()):
+    return await list_documents(ErrorCode, response, params, model=ErrorCodeModel)
 
 
 @app.post("/errorcode", response_model=ErrorCodeModel, status_code=HTTPStatus.CREATED, tags=['errorcode'])
-async def add_errorcode(item: ErrorCodeModel):
+async def add_errorcode(item: ErrorCodeModel, prefer: ReturnPreference = Depends(return_preference)):
     item.code = item.code.lower()
     item = jsonable_encoder(item)
-    new = await ErrorCode.insert_one(item)
-    return await ErrorCode.find_one({"_id": new.inserted_id})
+    response = await insert_document(ErrorCode, item, prefer)
+    await versions.bump(ErrorCode.name)
+    return response
 
 
-@app.get("/errorcode/{item_id}", response_model=list[ErrorCodeModel], tags=['errorcode'])
-async def show_errorcode(item_id: str):
+@app.get("/errorcode/{item_id}", response_model=list[partial_model(ErrorCodeModel)], response_model_exclude_unset=True,
+         tags=['errorcode'], dependencies=[conditional_get(ErrorCode.name)])
+async def show_errorcode(item_id: str, response: Response, params: ListParams = Depends()):
     item_id = item_id.lower()
-    item = await ErrorCode.find({"code": item_id}).to_list(length=None)
+    item = await list_documents(ErrorCode, response, params, {"code": item_id}, model=ErrorCodeModel)
     if item is None:
         raise HTTPException(
             status_code=404, detail=f"errorcode {item_id} not found")
     return item
+
+
+# /autocomplete
+
+@app.get("/autocomplete", tags=['autocomplete'])
+async def get_autocomplete(q: str = Query(..., min_length=1),
+                           kinds: list[AutocompleteKind] | None = Query(default=None, alias='kind'),
+                           limit: int = Query(default=10, gt=0, le=AUTOCOMPLETE_MAX_LIMIT)):
+    return autocomplete(q, kinds or list(AutocompleteKind), limit)
+
+
+# /search
+
+SEARCHABLE = {
+    SearchCollection.storage: (Storage, ItemModel),
+    SearchCollection.used: (Used, UsedModel),
+    SearchCollection.tools: (Tools, ToolsModel),
+}
+
+
+@app.get("/search", tags=['search'])
+async def search_items(q: str = Query(..., min_length=1),
+                       collections: list[SearchCollection] | None = Query(default=None),
+                       limit: int = Query(default=20, gt=0, le=SEARCH_MAX_LIMIT),
+                       offset: int = Query(default=0, ge=0),
+                       fields: list[str] | None = Depends(requested_fields)):
+    selected = {}
+    for name in collections or SEARCHABLE:
+        collection, model = SEARCHABLE[name]
+        selected[name.value] = (collection, fields_projection(model, fields))
+    return await search(selected, q, limit, offset)
+
+
+# /imports
+
+@app.get("/imports/{job_id}", tags=['imports'])
+async def show_import(job_id: str):
+    job = await ImportJobs.find_one({"_id": job_id})
+
+    if job is None:
+        raise HTTPException(
+            status_code=404, detail=f"import {job_id} not found")
+
+    return job
+
+
+# /diagnostics
+
+@app.get("/diagnostics/indexes", tags=['diagnostics'])
+async def get_indexes():
+    return await describe_indexes()
+
+
+@app.get("/diagnostics/cache", tags=['diagnostics'])
+async def get_cache_stats():
+    return {**reference_cache.describe(), "arrivals": arrival_cache.describe()}
+
+
+@app.get("/diagnostics/ingest", tags=['diagnostics'])
+async def get_ingest_stats():
+    return {"camera": camera_buffer.describe(), "camera_dedup": camera_dedup.describe(),
+            "events": broadcaster.describe()}
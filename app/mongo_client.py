@@ -1,5 +1,8 @@
 import os
 import motor.motor_asyncio as motor
+from pymongo import IndexModel
+
+from app.search import search_index
 
 MONGO_CONNECTION_STR = os.getenv('GARAGE_MONGO_CONNECTION_STR')
 
@@ -7,18 +10,67 @@ if not MONGO_CONNECTION_STR:
     raise EnvironmentError("Please define GARAGE_MONGO_CONNECTION_STR in env")
 
 client = motor.AsyncIOMotorClient(MONGO_CONNECTION_STR)
-CUSTOMERS = client['main']['customers']
-SUPPLIER = client['main']['supplier']
-CARS = client['main']['cars']
-Storage = client['main']['storage']
-Used = client['main']['used']
-Tools = client['main']['tools']
-Tipul = client['main']['tipul']
-TipulGroup = client['main']['tipulgroup']
-Repairs = client['main']['repairs']
-RepairsFinish = client['main']['repairsfinish']
-Area = client['main']['area']
-Camera = client['main']['camera']
-Category = client['main']['category']
-CategoryTools = client['main']['categorytools']
-ErrorCode = client['main']['errorcode']
+# Returned by standalone servers, which don't support transactions
+ILLEGAL_OPERATION = 20
+
+# Indexes each collection needs beyond `_id`, created at startup by app.indexes
+INDEXES: dict[str, list[IndexModel]] = {}
+COLLECTIONS: dict[str, motor.AsyncIOMotorCollection] = {}
+
+
+def collection(name: str, *indexes: IndexModel) -> motor.AsyncIOMotorCollection:
+    COLLECTIONS[name] = client['main'][name]
+    INDEXES[name] = list(indexes)
+    return COLLECTIONS[name]
+
+
+CUSTOMERS = collection('customers',
+                       IndexModel('cars', background=True))
+SUPPLIER = collection('supplier')
+CARS = collection('cars',
+                  IndexModel('license_plate_number', unique=True, background=True))
+Storage = collection('storage',
+                     IndexModel('barcode', background=True),
+                     IndexModel('category', background=True),
+                     search_index())
+# Ledger of every stock change made through the movements API
+StockMovements = collection('stockmovements',
+                            IndexModel([('item_id', 1), ('time_stamp', -1)], background=True))
+Used = collection('used',
+                  search_index())
+Tools = collection('tools',
+                   search_index())
+Tipul = collection('tipul')
+TipulGroup = collection('tipulgroup')
+Repairs = collection('repairs')
+RepairsFinish = collection('repairsfinish',
+                           IndexModel('license_plate_number', background=True))
+Area = collection('area')
+# LPR camera events, a time-series collection set up by app.camera_events
+Camera = collection('cameraevents')
+# Events of the plain collection used before, copied over once by app.camera_events
+LegacyCamera = client['main']['camera']
+# Progress and leases of one-off data migrations
+Migrations = collection('migrations')
+Category = collection('category')
+CategoryTools = collection('categorytools')
+ErrorCode = collection('errorcode',
+                       IndexModel('code', background=True))
+
+# data.gov.il lookup caches, entries expire at their own `expires_at`
+GovVehiclesCache = collection('govcache_vehicles',
+                              IndexModel('expires_at', expireAfterSeconds=0, background=True))
+GovModelsCache = collection('govcache_models',
+                            IndexModel('expires_at', expireAfterSeconds=0, background=True))
+# Which data.gov.il resource answered for a plate, when it isn't the main registry
+GovVehicleSources = collection('govcache_sources')
+
+# Progress of file imports, kept for a week
+ImportJobs = collection('importjobs',
+                        IndexModel('created_at', expireAfterSeconds=7 * 24 * 3600, background=True))
+
+# Write counters behind the ETags of reference collections, see app.conditional
+Versions = collection('versions')
+
+# Capped log of pushed events, tailed by every worker, see app.events
+Events = collection('events')
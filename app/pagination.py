@@ -0,0 +1,92 @@
+import base64
+import binascii
+import os
+from http import HTTPStatus
+
+from bson import json_util
+from bson.errors import BSONError
+from fastapi import HTTPException, Query, Response
+
+DEFAULT_PAGE_LIMIT = int(os.getenv('GARAGE_DEFAULT_PAGE_LIMIT', 100))
+MAX_PAGE_LIMIT = int(os.getenv('GARAGE_MAX_PAGE_LIMIT', 1000))
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class PageParams:
+    """
+    Opt-in keyset pagination. Without `limit` and `after` a list route keeps
+    returning the whole collection, so existing clients are unaffected.
+    """
+
+    def __init__(self,
+                 limit: int | None = Query(default=None, gt=0, le=MAX_PAGE_LIMIT),
+                 after: str | None = Query(default=None)):
+        self.limit = limit
+        self.after = after
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit is not None or self.after is not None
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    # A tampered cursor fails in whichever extended JSON decoder reads it
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError, BSONError, TypeError, KeyError, IndexError,
+            ArithmeticError):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail="Invalid cursor")
+    if not isinstance(values, list) or not values:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                            detail="Invalid cursor")
+    return values
+
+
+def keyset_filter(query: dict, sort_key: str, after: str | None) -> dict:
+    if after is None:
+        return query
+
+    values = decode_cursor(after)
+    if sort_key == '_id':
+        position = {'_id': {'$gt': values[-1]}}
+    else:
+        if len(values) != 2:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                                detail="Invalid cursor")
+        sort_value, last_id = values
+        position = {'$or': [{sort_key: {'$gt': sort_value}},
+                            {sort_key: sort_value, '_id': {'$gt': last_id}}]}
+
+    return {'$and': [query, position]} if query else position
+
+
+def cursor_for(document: dict, sort_key: str) -> str:
+    if sort_key == '_id':
+        return encode_cursor([document['_id']])
+    return encode_cursor([document.get(sort_key), document['_id']])
+
+
+async def paginate(collection, response: Response, page: PageParams,
+                   query: dict | None = None, sort_key: str = '_id',
+                   projection: dict | None = None) -> list[dict]:
+    query = query or {}
+    if not page.enabled:
+        return await collection.find(query, projection=projection).to_list(length=None)
+
+    limit = page.limit or DEFAULT_PAGE_LIMIT
+    sort = [('_id', 1)] if sort_key == '_id' else [(sort_key, 1), ('_id', 1)]
+
+    # Fetch one extra document to know whether another page exists
+    documents = await collection.find(keyset_filter(query, sort_key, page.after), projection=projection) \
+        .sort(sort).limit(limit + 1).to_list(length=None)
+
+    if len(documents) > limit:
+        documents = documents[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = cursor_for(documents[-1], sort_key)
+
+    return documents
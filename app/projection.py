@@ -0,0 +1,66 @@
+from functools import lru_cache
+from http import HTTPStatus
+from typing import Optional, get_type_hints
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel, Field, create_model
+
+
+def requested_fields(fields: str | None = Query(
+        default=None, description="Comma separated fields to return, e.g. `license_plate_number,car.tozar`")
+) -> list[str] | None:
+    if fields is None:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()] or None
+
+
+def fields_projection(model: type[BaseModel], fields: list[str] | None) -> dict | None:
+    if not fields:
+        return None
+
+    paths = []
+    for path in fields:
+        top, *rest = path.split('.')
+        field = model.__fields__.get(top)
+        if field is None:
+            field = next((field for field in model.__fields__.values() if field.alias == top), None)
+        if field is None:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST,
+                                detail=f"Unknown field {path}")
+        paths.append('.'.join([field.alias, *rest]))
+
+    projection = {}
+    for path in sorted(set(paths)):
+        # Mongo rejects a path together with its parent, and the parent covers it anyway
+        if not any(path.startswith(selected + '.') for selected in projection):
+            projection[path] = 1
+    return projection
+
+
+@lru_cache(maxsize=None)
+def partial_model(model: type[BaseModel]) -> type[BaseModel]:
+    """
+    Same fields as `model`, all optional, for responses that may be projected.
+    Routes using it set `response_model_exclude_unset` so fields that weren't
+    asked for are left out instead of being sent as null.
+    """
+    # Plain annotations, without the Field constraints, since defaults are sent as values too
+    hints = get_type_hints(model)
+    fields = {
+        name: (Optional[hints[name]], Field(default=None, alias=field.alias))
+        for name, field in model.__fields__.items()
+    }
+    return create_model(f'Partial{model.__name__}', __config__=model.__config__, **fields)
+
+
+@lru_cache(maxsize=None)
+def model_defaults(model: type[BaseModel]) -> dict:
+    return {field.alias: field.default for field in model.__fields__.values()
+            if not field.required and field.default_factory is None}
+
+
+def with_defaults(model: type[BaseModel], document: dict | None, fields: list[str] | None) -> dict | None:
+    # Without ?fields= the response is the full model, defaults included
+    if fields or document is None:
+        return document
+    return {**model_defaults(model), **document}
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from collections import Counter
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.conditional import versions
+from app.mongo_client import client, Area, Category, CategoryTools, Tipul, TipulGroup, ErrorCode
+
+# Raised by `watch` on servers that aren't part of a replica set
+CHANGE_STREAMS_UNSUPPORTED = 40573
+WATCH_RETRY_DELAY = 5
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCache:
+    """
+    Per-worker read-through cache of small, rarely written collections.
+
+    An entry is valid for the collection version it was loaded at, so a write
+    on any worker expires it once the version poll sees the bump. Where Mongo
+    supports change streams, entries are also dropped as soon as a change is
+    seen, including writes made outside the API.
+    """
+
+    def __init__(self, collections):
+        self._collections = {collection.name: collection for collection in collections}
+        self._entries: dict[str, tuple[int, list[dict], dict]] = {}
+        # Bumped on every invalidation, so a load that raced a change isn't kept
+        self._generations = Counter()
+        self.stats = {name: Counter() for name in self._collections}
+        self.watching = False
+
+    def caches(self, collection) -> bool:
+        return collection.name in self._collections
+
+    async def _entry(self, name: str) -> tuple[int, list[dict], dict]:
+        version = versions.get(name)
+        entry = self._entries.get(name)
+        if entry is not None and version is not None and entry[0] == version:
+            self.stats[name]['hits'] += 1
+            return entry
+
+        self.stats[name]['misses'] += 1
+        generation = self._generations[name]
+        documents = await self._collections[name].find().to_list(length=None)
+        entry = (version, documents, {document['_id']: document for document in documents})
+        if version is not None and generation == self._generations[name]:
+            self._entries[name] = entry
+        return entry
+
+    async def documents(self, collection) -> list[dict]:
+        _, documents, _ = await self._entry(collection.name)
+        return documents
+
+    async def find_one(self, collection, _id: str, projection: dict | None = None) -> dict | None:
+        if projection is not None:
+            return await collection.find_one({"_id": _id}, projection=projection)
+        _, _, by_id = await self._entry(collection.name)
+        return by_id.get(_id)
+
+    def invalidate(self, name: str) -> None:
+        self._generations[name] += 1
+        if self._entries.pop(name, None) is not None:
+            self.stats[name]['invalidations'] += 1
+
+    async def watch(self) -> None:
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self._collections)}}}]
+        while True:
+            try:
+                async with client['main'].watch(pipeline) as stream:
+                    self.watching = True
+                    async for change in stream:
+                        self.invalidate(change['ns']['coll'])
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable, reference cache follows version polling")
+                    return
+                logger.warning("Reference cache change stream failed: %s", e)
+            except PyMongoError as e:
+                logger.warning("Reference cache change stream failed: %s", e)
+            finally:
+                self.watching = False
+            # Changes missed while reconnecting are unknown, start over
+            for name in self._collections:
+                self.invalidate(name)
+            await asyncio.sleep(WATCH_RETRY_DELAY)
+
+    def describe(self) -> dict:
+        return {
+            "change_stream": self.watching,
+            "collections": {
+                name: {
+                    **{key: self.stats[name][key] for key in ('hits', 'misses', 'invalidations')},
+                    "version": versions.get(name),
+                    "cached": self._entries[name][0] if name in self._entries else None,
+                    "size": len(self._entries[name][1]) if name in self._entries else 0,
+                }
+                for name in self._collections
+            },
+        }
+
+
+reference_cache = ReferenceCache([Area, Category, CategoryTools, Tipul, TipulGroup, ErrorCode])
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import re
+from enum import Enum
+
+from pymongo import IndexModel, TEXT
+
+SEARCH_MAX_LIMIT = int(os.getenv('GARAGE_SEARCH_MAX_LIMIT', 100))
+
+SEARCH_WEIGHTS = {
+    'name': 10,
+    'barcode': 10,
+    'category': 3,
+    'sub': 3,
+    'car_types': 2,
+    'location': 1,
+    'notes': 1,
+}
+
+# Single-letter Hebrew prefixes: ה ו ב כ ל מ ש (e.g. "והבלמים" -> "בלמים")
+HEBREW_PREFIXES = 'הובכלמש'
+HEBREW_WORD = re.compile(r'[א-ת]+')
+TOKEN = re.compile(r'\w+')
+
+
+class SearchCollection(str, Enum):
+    storage = 'storage'
+    used = 'used'
+    tools = 'tools'
+
+
+def search_index() -> IndexModel:
+    # Mongo has no Hebrew stemmer, so text is only split into words
+    return IndexModel([(field, TEXT) for field in SEARCH_WEIGHTS], weights=SEARCH_WEIGHTS,
+                      default_language='none', name='search_text', background=True)
+
+
+def search_terms(query: str) -> list[str]:
+    """
+    The words of the query, with Hebrew prefixes handled on the query side
+    only: the bare word is looked up too, up to two prefix letters deep, and
+    since stored words keep theirs, so is the bare word behind each single
+    prefix letter (e.g. "טויוטה" also finds "לטויוטה", not "ולטויוטה").
+    """
+    terms = []
+    for token in TOKEN.findall(query.lower()):
+        terms.append(token)
+        word = token
+        for _ in range(2):
+            if not HEBREW_WORD.fullmatch(word) or len(word) <= 3 or word[0] not in HEBREW_PREFIXES:
+                break
+            word = word[1:]
+            terms.append(word)
+        if HEBREW_WORD.fullmatch(word) and len(word) >= 3:
+            terms.extend(prefix + word for prefix in HEBREW_PREFIXES)
+    return list(dict.fromkeys(terms))
+
+
+def projection_for(projection: dict | None) -> dict:
+    # `score` is reserved for the ranking, whatever a document stores under it
+    projection = {path: 1 for path in projection or {} if path.split('.')[0] != 'score'}
+    projection['score'] = {"$meta": "textScore"}
+    return projection
+
+
+async def _search_collection(name: str, collection, terms: str, projection: dict, limit: int) -> list[dict]:
+    cursor = collection.find({"$text": {"$search": terms}}, projection=projection) \
+        .sort([("score", {"$meta": "textScore"})]).limit(limit)
+    return [dict(document, collection=name) async for document in cursor]
+
+
+async def search(collections: dict, query: str, limit: int, offset: int = 0) -> dict:
+    """
+    Searches each collection, given as name -> (collection, projection of the
+    fields to return or None for all), and merges the hits by score.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return {"items": [], "next_offset": None}
+
+    # Every collection has to return enough to fill the page after merging
+    per_collection = offset + limit + 1
+    results = await asyncio.gather(*(
+        _search_collection(name, collection, ' '.join(terms), projection_for(projection), per_collection)
+        for name, (collection, projection) in collections.items()
+    ))
+
+    ranked = sorted((document for documents in results for document in documents),
+                    key=lambda document: document['score'], reverse=True)
+    page = ranked[offset:offset + limit]
+    return {
+        "items": page,
+        "next_offset": offset + limit if len(ranked) > offset + limit else None,
+    }
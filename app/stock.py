@@ -0,0 +1,106 @@
+import asyncio
+import re
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+from app.mongo_client import ILLEGAL_OPERATION
+from models.stock_movement_model import MovementKind, StockMovementModel
+
+# amount_in_stock may be stored as a string, so it is normalised inside the
+# update; a value that isn't a whole number reads as null and is never changed
+AMOUNT_IN_STOCK = {"$convert": {"input": "$amount_in_stock", "to": "int", "onError": None, "onNull": 0}}
+READABLE_STOCK = {"$ne": [AMOUNT_IN_STOCK, None]}
+INTEGER = re.compile(r'-?\d+')
+
+
+def stock_amount(value) -> int | None:
+    # Same reading as AMOUNT_IN_STOCK, for a value fetched from Mongo
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return int(value) if INTEGER.fullmatch(value) else None
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def movement_delta(movement: StockMovementModel) -> int:
+    return -movement.quantity if movement.kind == MovementKind.take else movement.quantity
+
+
+async def _refusal(collection, item_id: str, session=None) -> HTTPException:
+    item = await collection.find_one({"_id": item_id}, projection={"amount_in_stock": 1}, session=session)
+    if item is None:
+        return HTTPException(status_code=HTTPStatus.NOT_FOUND,
+                             detail=f"storage {item_id} not found")
+    if stock_amount(item.get('amount_in_stock')) is None:
+        return HTTPException(status_code=HTTPStatus.CONFLICT,
+                             detail=f"amount_in_stock of {item_id} isn't a whole number: "
+                                    f"{item['amount_in_stock']!r}, fix it before moving stock")
+    return HTTPException(status_code=HTTPStatus.CONFLICT,
+                         detail=f"Not enough of {item_id} in stock")
+
+
+async def _apply(collection, ledger, item_id: str, movement: StockMovementModel, session=None) -> dict:
+    delta = movement_delta(movement)
+    # Only matches while there is enough stock, so concurrent takes can't go below zero
+    condition = {"$gte": [AMOUNT_IN_STOCK, -delta]} if delta < 0 else READABLE_STOCK
+    updated = await collection.find_one_and_update(
+        {"_id": item_id, "$expr": condition},
+        [{"$set": {"amount_in_stock": {"$add": [AMOUNT_IN_STOCK, delta]}}}],
+        projection={"amount_in_stock": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if updated is None:
+        raise await _refusal(collection, item_id, session)
+
+    movement.item_id = item_id
+    movement.amount_after = updated['amount_in_stock']
+    entry = jsonable_encoder(movement)
+    # Keep a real date in the ledger so it can be queried by range
+    entry['time_stamp'] = movement.time_stamp
+    try:
+        await ledger.insert_one(entry, session=session)
+    except Exception:
+        if session is None:
+            # No transaction to roll back: undo the stock change, so a retry
+            # after the error applies the movement once
+            await collection.update_one({"_id": item_id}, {"$inc": {"amount_in_stock": -delta}})
+        raise
+    return entry
+
+
+async def apply_movement(collection, ledger, item_id: str, movement: StockMovementModel) -> dict:
+    """
+    Changes the stock of an item and records it in the ledger, in one
+    transaction. Standalone servers, which have none, get the stock change
+    undone if recording it fails.
+    """
+    async with await collection.database.client.start_session() as session:
+        try:
+            # Retried on write conflicts, e.g. two takes of the same item
+            return await session.with_transaction(
+                lambda session: _apply(collection, ledger, item_id, movement, session))
+        except OperationFailure as e:
+            if e.code != ILLEGAL_OPERATION:
+                raise
+    return await _apply(collection, ledger, item_id, movement)
+
+
+async def apply_movements(collection, ledger, movements: list[StockMovementModel]) -> list[dict]:
+    async def apply(index: int, movement: StockMovementModel) -> dict:
+        if movement.item_id is None:
+            return {"index": index, "status": "error", "detail": "item_id is required"}
+        try:
+            return {"index": index, "status": "ok",
+                    "movement": await apply_movement(collection, ledger, movement.item_id, movement)}
+        except HTTPException as e:
+            return {"index": index, "status": "error", "detail": e.detail}
+
+    return await asyncio.gather(*(apply(index, movement) for index, movement in enumerate(movements)))
@@ -0,0 +1,47 @@
+import os
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.fast_json import dumps, trusted_document
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+STREAM_BATCH_SIZE = int(os.getenv('GARAGE_STREAM_BATCH_SIZE', 500))
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get('accept', '')
+
+
+def ndjson_line(document: dict) -> bytes:
+    return dumps(document) + b'\n'
+
+
+async def _iterate_ndjson(cursor, batch_size: int, shape):
+    # Flush one chunk per cursor batch, so memory is bounded by the batch size
+    # and the first bytes leave as soon as Mongo returns the first batch
+    lines = []
+    async for document in cursor:
+        lines.append(ndjson_line(shape(document)))
+        if len(lines) >= batch_size:
+            yield b''.join(lines)
+            lines = []
+    if lines:
+        yield b''.join(lines)
+
+
+def stream_ndjson(collection, query: dict | None = None, sort=None, limit: int | None = None,
+                  batch_size: int = STREAM_BATCH_SIZE, projection: dict | None = None,
+                  headers: dict | None = None, model: type[BaseModel] | None = None,
+                  fields: list[str] | None = None) -> StreamingResponse:
+    cursor = collection.find(query or {}, projection=projection).batch_size(batch_size)
+    if sort is not None:
+        cursor = cursor.sort(sort)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    # Lines are shaped like the documents of a JSON list of the same model
+    shape = (lambda document: document) if model is None else \
+        (lambda document: trusted_document(model, document, fields))
+    return StreamingResponse(_iterate_ndjson(cursor, batch_size, shape), media_type=NDJSON_MEDIA_TYPE,
+                             headers=headers)
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from bson import ObjectId
 from pydantic import BaseModel, Field, validator
 
@@ -9,6 +11,11 @@ class CameraModel(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     license_plate_number: str = Field(...)
     time_stamp: str = Field(...)
+    # Parsed from time_stamp by the API, used for time-range queries
+    time: datetime | None = Field(default=None)
+    # Repeated reads of the plate collapsed into this event
+    last_seen: datetime | None = Field(default=None)
+    hits: int | None = Field(default=None)
 
     class Config:
         allow_population_by_field_name = True
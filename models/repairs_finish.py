@@ -18,6 +18,8 @@ class RepairFinishModel(BaseModel):
     customer: dict | None = Field(default=None)
     total: float | None = Field(default=0)
     kilometer: int | None = Field(default=0)
+    # Products that didn't move stock when the repair was finished, and why
+    skipped_products: list[dict] | None = Field(default=None)
 
     class Config:
         allow_population_by_field_name = True
@@ -38,3 +40,20 @@ class RepairFinishModel(BaseModel):
                 "car":"1234567",
             }
         }
+
+
+class FinishRepairModel(BaseModel):
+    time_stamp_end: str | None = Field(default=None)
+    note: str | None = Field(default=None)
+    total: float | None = Field(default=None)
+    kilometer: int | None = Field(default=None)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "time_stamp_end": "2023-06-21T16:30:00",
+                "note": "customer paid cash",
+                "total": 850,
+                "kilometer": 123456,
+            }
+        }
@@ -4,6 +4,12 @@ from models.base_update_model import BaseUpdateModel, MISSING
 from models.pyobjectid import PyObjectId
 
 
+class RepairProductModel(BaseModel):
+    # A storage item used in a repair, taken out of stock when the repair is finished
+    item_id: str = Field(..., alias="_id")
+    amount: int = Field(..., gt=0)
+
+
 class RepairModel(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     license_plate_number: str = Field(...)
@@ -0,0 +1,40 @@
+from datetime import datetime
+from enum import Enum
+
+from bson import ObjectId
+from pydantic import BaseModel, Field
+
+from models.pyobjectid import PyObjectId
+
+
+class MovementKind(str, Enum):
+    take = 'take'
+    give_back = 'return'
+    receive = 'receive'
+
+
+class StockMovementModel(BaseModel):
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    item_id: str | None = Field(default=None)
+    kind: MovementKind = Field(...)
+    quantity: int = Field(..., gt=0)
+    repair_id: str | None = Field(default=None)
+    note: str | None = Field(default=None)
+    time_stamp: datetime = Field(default_factory=datetime.utcnow)
+    amount_after: int | None = Field(default=None)
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {
+            ObjectId: str
+        }
+        schema_extra = {
+            "example": {
+                "item_id": "63a1f0c2e4b0a1b2c3d4e5f6",
+                "kind": "take",
+                "quantity": 2,
+                "repair_id": "63a1f0c2e4b0a1b2c3d4e5f7",
+                "note": "brake pads for lift big",
+            }
+        }
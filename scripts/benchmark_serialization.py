@@ -0,0 +1,73 @@
+"""
+Compares the validated response path of list routes with the trusted-read one,
+on synthetic storage documents (no Mongo needed):
+
+    python -m scripts.benchmark_serialization [rows]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from bson import ObjectId
+
+os.environ.setdefault('GARAGE_MONGO_CONNECTION_STR', 'mongodb://localhost:27017')
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+
+from app.fast_json import FastJSONResponse, trusted_document  # noqa: E402
+from app.main import app  # noqa: E402
+from models.item_model import ItemModel  # noqa: E402
+
+
+def storage_documents(rows: int) -> list[dict]:
+    return [{
+        "_id": str(ObjectId()),
+        "barcode": [f"72900{i:08d}"],
+        "name": f"מסנן שמן {i}",
+        "category": "filters",
+        "sub": ["oil"],
+        "supplier": "supplier",
+        "notes": None,
+        "amount_in_stock": str(i % 40),
+        "max_amount_in_stock": 40,
+        "car_types": ["טויוטה קורולה", "מאזדה 3"],
+        "location": "A-12",
+        "price_cost": 35.5,
+        "price_sell": 60,
+    } for i in range(rows)]
+
+
+def validated(route, documents: list[dict]) -> bytes:
+    content = asyncio.run(serialize_response(field=route.response_field, response_content=documents,
+                                             exclude_unset=route.response_model_exclude_unset))
+    return JSONResponse(content).body
+
+
+def trusted(documents: list[dict]) -> bytes:
+    return FastJSONResponse([trusted_document(ItemModel, document, None) for document in documents]).body
+
+
+def best_of(repeat: int, run) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(rows: int = 10_000, repeat: int = 5) -> None:
+    route = next(route for route in app.routes if route.path == '/storage' and 'GET' in route.methods)
+    documents = storage_documents(rows)
+
+    slow = best_of(repeat, lambda: validated(route, documents))
+    fast = best_of(repeat, lambda: trusted(documents))
+    print(f"{rows} documents, best of {repeat}")
+    print(f"  validated: {slow * 1000:8.1f} ms")
+    print(f"  trusted:   {fast * 1000:8.1f} ms  ({slow / fast:.1f}x)")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,4 @@
+import os
+
+# The Mongo client connects lazily, so importing the app needs only a URI
+os.environ.setdefault('GARAGE_MONGO_CONNECTION_STR', 'mongodb://localhost:27017')
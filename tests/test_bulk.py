@@ -0,0 +1,44 @@
+import asyncio
+
+from app.bulk import validate_rows, bulk_upsert
+from models.item_model import ItemModel
+
+
+class Outcome:
+    def __init__(self, upserted=()):
+        self.bulk_api_result = {"upserted": list(upserted)}
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.operations = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+        return Outcome()
+
+
+def upsert(rows):
+    collection = RecordingCollection()
+    documents, errors = validate_rows(ItemModel, rows)
+    assert errors == []
+    asyncio.run(bulk_upsert(collection, documents, upsert_on_barcode=True))
+    return collection.operations[0]._doc
+
+
+def test_barcode_upsert_sets_only_supplied_fields():
+    update = upsert([{"barcode": "123", "name": "filter", "category": "oil", "price_cost": 12}])
+
+    assert update["$set"] == {"barcode": "123", "name": "filter", "category": "oil", "price_cost": 12}
+    # Stored stock, location and notes are left alone, defaults only fill a new item
+    for field in ("amount_in_stock", "location", "notes", "price_sell", "car_types"):
+        assert field not in update["$set"]
+        assert field in update["$setOnInsert"]
+    assert "_id" in update["$setOnInsert"]
+
+
+def test_supplied_fields_move_out_of_set_on_insert():
+    update = upsert([{"barcode": "123", "name": "filter", "category": "oil", "location": "A-12"}])
+
+    assert update["$set"]["location"] == "A-12"
+    assert "location" not in update["$setOnInsert"]
@@ -0,0 +1,15 @@
+from app.close_out import product_quantities
+
+
+def test_product_quantities_totals_per_item_and_reports_the_rest():
+    quantities, skipped = product_quantities([
+        {"_id": "a", "amount": 2, "name": "oil filter"},
+        {"_id": "a", "amount": 1},
+        {"_id": "b", "amount": "3"},
+        {"id": "c", "quantity": 1},
+        {"_id": "d"},
+        {"_id": "e", "amount": "lots"},
+    ])
+
+    assert quantities == {"a": 3, "b": 3}
+    assert [row["index"] for row in skipped] == [3, 4, 5]
@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.bulk import validate_rows, bulk_upsert
+from app.imports import map_rows, parse_mapping
+from models.item_model import ItemModel
+from tests.test_bulk import RecordingCollection
+
+
+def test_price_list_import_leaves_stock_location_and_notes():
+    rows = iter([
+        ["Barcode", "Name", "Category", "Price_cost", "Notes"],
+        ["123", "filter", "oil", "12.5", ""],
+    ])
+    line_numbers, items = zip(*map_rows(rows, {}, ItemModel, {"supplier": "acme"}))
+    documents, errors = validate_rows(ItemModel, list(items), row_numbers=list(line_numbers))
+    assert errors == []
+
+    collection = RecordingCollection()
+    asyncio.run(bulk_upsert(collection, documents, upsert_on_barcode=True))
+    update = collection.operations[0]._doc
+
+    assert set(update["$set"]) == {"barcode", "name", "category", "price_cost", "supplier"}
+    assert {"amount_in_stock", "location", "notes"} <= set(update["$setOnInsert"])
+
+
+def test_mapping_onto_an_unknown_field_is_rejected():
+    assert parse_mapping('{"מחיר": "price_cost"}', ItemModel) == {"מחיר": "price_cost"}
+    with pytest.raises(HTTPException) as raised:
+        parse_mapping('{"מחיר": "price"}', ItemModel)
+    assert raised.value.status_code == 400
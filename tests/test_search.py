@@ -0,0 +1,11 @@
+from app.search import projection_for, search_terms
+
+
+def test_search_terms_match_prefixed_words_both_ways():
+    assert 'בלמים' in search_terms('והבלמים')
+    assert 'לטויוטה' in search_terms('טויוטה')
+    assert search_terms('oil') == ['oil']
+
+
+def test_projection_keeps_score_reserved():
+    assert projection_for({"name": 1, "score": 1}) == {"name": 1, "score": {"$meta": "textScore"}}
@@ -0,0 +1,10 @@
+from app.stock import stock_amount
+
+
+def test_stock_amount_reads_like_the_update_does():
+    assert stock_amount(None) == 0
+    assert stock_amount(7) == 7
+    assert stock_amount("12") == 12
+    assert stock_amount("-3") == -3
+    for unreadable in ("5.5", "12 ", "", "lots"):
+        assert stock_amount(unreadable) is None